@@ -0,0 +1,109 @@
+import argparse
+from collections import Counter
+import json
+import os
+import shutil
+import tempfile
+
+from document_data_extracter import DocumentDataExtraction
+
+
+def leaf_values(data) -> Counter:
+    # every scalar in the page json, normalized, so two extractions can be compared
+    # without depending on how the model chose to nest or name the keys
+    values = Counter()
+    if isinstance(data, dict):
+        for value in data.values():
+            values.update(leaf_values(value))
+    elif isinstance(data, list):
+        for value in data:
+            values.update(leaf_values(value))
+    elif data is not None and str(data).strip():
+        values[" ".join(str(data).lower().split())] += 1
+    return values
+
+
+def run_mode(args, mode: str, output_path: str):
+    extractor = DocumentDataExtraction(args.source, output_path, args.model, dpi=args.dpi, max_in_flight=args.max_in_flight,
+                                       cache_path=args.cache_path, extraction_mode=mode, min_text_chars=args.min_text_chars)
+    job = extractor.extract(recursive=args.recursive)
+    with open(os.path.join(output_path, "extraction_manifest.json"), "r", encoding="utf-8") as f:
+        return job, json.load(f)["files"]
+
+
+def compare(reference_files: dict, candidate_files: dict):
+    # vision output is the reference: precision is how much of the tiered values it also
+    # has, recall how much of it the tiered run found
+    pages = []
+    for relative_path, entry in candidate_files.items():
+        reference_entry = reference_files.get(relative_path)
+        if not reference_entry or not os.path.exists(entry["output"]) or not os.path.exists(reference_entry["output"]):
+            continue
+        with open(entry["output"], "r", encoding="utf-8") as f:
+            candidate_pages = json.load(f)
+        with open(reference_entry["output"], "r", encoding="utf-8") as f:
+            reference_pages = json.load(f)
+        for page_number, (candidate, reference) in enumerate(zip(candidate_pages, reference_pages)):
+            candidate_values, reference_values = leaf_values(candidate), leaf_values(reference)
+            matched = sum((candidate_values & reference_values).values())
+            pages.append({
+                "file": relative_path,
+                "page": page_number + 1,
+                "method": entry["pages"][page_number].get("decision", {}).get("method"),
+                "precision": matched / sum(candidate_values.values()) if candidate_values else 1.0,
+                "recall": matched / sum(reference_values.values()) if reference_values else 1.0,
+            })
+    return pages
+
+
+def main():
+    current_directory = os.path.dirname(__file__)
+    parser = argparse.ArgumentParser(description="Extract the same pdfs vision only and tiered, and compare speed, tokens and agreement")
+    parser.add_argument("--source", default=os.path.join(current_directory, "./dataEvents/source"))
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--recursive", action="store_true")
+    parser.add_argument("--dpi", type=int, default=72)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--min-text-chars", type=int, default=200)
+    parser.add_argument("--cache-path", help="page cache to reuse between comparisons, by default every page is sent to the model")
+    parser.add_argument("--output-path", help="keep both outputs here instead of a temporary directory")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    args = parser.parse_args()
+
+    output_path = args.output_path or tempfile.mkdtemp(prefix="extraction_compare_")
+    try:
+        vision, vision_files = run_mode(args, "vision", os.path.join(output_path, "vision"))
+        tiered, tiered_files = run_mode(args, "tiered", os.path.join(output_path, "tiered"))
+        pages = compare(vision_files, tiered_files)
+    finally:
+        if not args.output_path:
+            shutil.rmtree(output_path, ignore_errors=True)
+
+    results = {mode: {"seconds": job.elapsed, "pages": job.pages_done, "failed_pages": job.pages_failed, "by_method": job.pages_by_method,
+                      "prompt_tokens": job.prompt_tokens, "completion_tokens": job.completion_tokens, "cost": job.cost()}
+               for mode, job in (("vision", vision), ("tiered", tiered))}
+    results["pages"] = pages
+    for method in ("text", "image"):
+        compared = [page for page in pages if page["method"] == method]
+        if compared:
+            results[f"{method}_agreement"] = {"pages": len(compared),
+                                              "precision": sum(page["precision"] for page in compared) / len(compared),
+                                              "recall": sum(page["recall"] for page in compared) / len(compared)}
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+    for mode in ("vision", "tiered"):
+        timings = results[mode]
+        print(f"{mode:<7} {timings['seconds']:.1f}s  {timings['pages']} pages {timings['by_method']}  "
+              f"tokens {timings['prompt_tokens']}+{timings['completion_tokens']}")
+    for page in pages:
+        print(f"{page['file']} page {page['page']}: {page['method']}  precision {page['precision']:.2f}  recall {page['recall']:.2f}")
+    for method in ("text", "image"):
+        if f"{method}_agreement" in results:
+            agreement = results[f"{method}_agreement"]
+            print(f"{method} pages vs vision: {agreement['pages']} pages, precision {agreement['precision']:.3f}  recall {agreement['recall']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,72 +1,24 @@
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, InternalServerError, RateLimitError
 import dotenv
 import os
-import io
-from PIL import Image
 import base64
 import json
+import random
+import threading
+import time
 import fitz  # PyMuPDF
 
+from extraction_jobs import ExtractionJob
+from page_cache import PageCache
 
-class DocumentDataExtraction:
-    def __init__(self, read_files_path: str, out_data_path: str , model: str = ""):
-        self._load_environs()
-        
-        if not model:
-            self.MODEL = "gpt-4o-mini"
-        else:
-            self.MODEL = model
-
-        self.path_to_documents = read_files_path
-        self.path_to_output = out_data_path
-        
-        self.client = OpenAI(
-            api_key=os.environ["OPENAI_API_KEY"]
-        )
-
-
-
-    @staticmethod
-    def _load_environs():
-        dotenv.load_dotenv()
-        if not os.getenv("GITHUB_TOKEN"):
-            raise ValueError("GITHUB_TOKEN is not set")
-        os.environ["OPENAI_API_KEY"] = os.getenv("GITHUB_TOKEN")
-        os.environ["OPENAI_BASE_URL"] = "https://models.inference.ai.azure.com/"
-
-
-    @staticmethod
-    def _encode_image(image_path):
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode("utf-8")
-
-
-    def pdf_to_base64_images(self, pdf_path):
-        #Handles PDFs with multiple pages
-        pdf_document = fitz.open(pdf_path)
-        base64_images = []
-        temp_image_paths = []
-
-        total_pages = len(pdf_document)
-
-        for page_num in range(total_pages):
-            page = pdf_document.load_page(page_num)
-            pix = page.get_pixmap()
-            img = Image.open(io.BytesIO(pix.tobytes()))
-            temp_image_path = f"temp_page_{page_num}.png"
-            img.save(temp_image_path, format="PNG")
-            temp_image_paths.append(temp_image_path)
-            base64_image = self._encode_image(temp_image_path)
-            base64_images.append(base64_image)
 
-        for temp_image_path in temp_image_paths:
-            os.remove(temp_image_path)
+IMAGE_MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "jpg": "image/jpeg"}
+EXTRACTION_MODES = ("vision", "tiered")
+PAGE_IMAGE = "image"
+PAGE_TEXT = "text"
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
 
-        return base64_images
-    
-    
-    def extract_invoice_data(self, base64_image):
-            system_prompt = f"""
+SYSTEM_PROMPT = """
             You are an OCR-like data extraction tool that extracts events like data from PDFs tabular data calendar.
         
             1. Please extract the data in this events table, written in spanish, by grouping data according to "Mes", "Día" and "Evento", and then output into JSON.
@@ -115,54 +67,195 @@ class DocumentDataExtraction:
             7. Please capture all of the rows and columns in the JSON object.
 
             """
-            
+USER_PROMPT = "extract the data in calendar of eventos and output into JSON "
+TEXT_USER_PROMPT = USER_PROMPT + "from this text read from the pdf page, tables are written as rows of | separated cells:\n\n"
+
+
+class DocumentDataExtraction:
+    def __init__(self, read_files_path: str, out_data_path: str , model: str = "", dpi: int = 72, image_format: str = "png",
+                 jpeg_quality: int = 85, max_in_flight: int = 8, max_retries: int = 4, backoff_seconds: float = 1.0,
+                 cache_path: str = None, temperature: float = 0.0, extraction_mode: str = "vision", min_text_chars: int = 200):
+        self._load_environs()
+        
+        if not model:
+            self.MODEL = "gpt-4o-mini"
+        else:
+            self.MODEL = model
+
+        self.path_to_documents = read_files_path
+        self.path_to_output = out_data_path
+        # 72 dpi is the PyMuPDF default; small print in scanned tables reads better at 150-200
+        self.dpi = dpi
+        if image_format.lower() not in IMAGE_MIME_TYPES:
+            raise ValueError(f"Unsupported image format {image_format}, use one of {', '.join(IMAGE_MIME_TYPES)}")
+        self.image_format = image_format.lower()
+        self.jpeg_quality = jpeg_quality
+        self.temperature = temperature
+        # "tiered" reads the pdf text layer first and only renders the pages without enough text
+        if extraction_mode not in EXTRACTION_MODES:
+            raise ValueError(f"Unsupported extraction mode {extraction_mode}, use one of {', '.join(EXTRACTION_MODES)}")
+        self.extraction_mode = extraction_mode
+        self.min_text_chars = min_text_chars
+        # no cache_path bypasses the page cache, every page is sent to the model
+        self.cache = PageCache(cache_path) if cache_path else None
+        
+        # one client (and connection pool) shared by every worker thread; retries are done
+        # in _extract_page so backoff is applied once, not on top of the client's own retries
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._queued = threading.Semaphore(max_in_flight * 2)
+        self.client = OpenAI(
+            api_key=os.environ["OPENAI_API_KEY"],
+            max_retries=0
+        )
+
+
+
+    @staticmethod
+    def _load_environs():
+        dotenv.load_dotenv()
+        if not os.getenv("GITHUB_TOKEN"):
+            raise ValueError("GITHUB_TOKEN is not set")
+        os.environ["OPENAI_API_KEY"] = os.getenv("GITHUB_TOKEN")
+        # GITHUB_MODELS_ENDPOINT switches to another OpenAI compatible server, e.g. the mock one
+        os.environ["OPENAI_BASE_URL"] = os.getenv("GITHUB_MODELS_ENDPOINT", "https://models.inference.ai.azure.com/")
+
+
+    def render_page(self, page) -> bytes:
+        # encodes straight from the pixmap buffer, no PIL round trip and no temp file
+        pix = page.get_pixmap(dpi=self.dpi)
+        if self.image_format == "png":
+            return pix.tobytes("png")
+        return pix.tobytes("jpeg", jpg_quality=self.jpeg_quality)
+
+
+    @staticmethod
+    def page_count(pdf_path) -> int:
+        with fitz.open(pdf_path) as pdf_document:
+            return len(pdf_document)
+
+
+    def page_text(self, page):
+        # the text layer with tables as | separated rows, and why the page does or doesn't use it
+        tables = page.find_tables().tables if hasattr(page, "find_tables") else []
+        table_rects = [fitz.Rect(table.bbox) for table in tables]
+        parts = []
+        for table in tables:
+            parts.append("\n".join("| " + " | ".join((cell or "").replace("\n", " ").strip() for cell in row) + " |" for row in table.extract()))
+        for block in page.get_text("blocks", sort=True):
+            # type 0 blocks are text, the ones inside a table are already in its rows
+            if block[6] == 0 and not any(fitz.Rect(block[:4]).intersects(rect) for rect in table_rects):
+                parts.append(block[4].strip())
+        text = "\n\n".join(part for part in parts if part)
+        chars = len(text.replace(" ", "").replace("\n", ""))
+        decision = {"chars": chars, "tables": len(tables)}
+        if chars < self.min_text_chars:
+            decision["reason"] = f"{chars} text chars, below {self.min_text_chars}"
+            return None, decision
+        if text.count("\ufffd") > chars * 0.05:
+            decision["reason"] = "unreadable text layer"
+            return None, decision
+        decision["reason"] = "text layer"
+        return text, decision
+
+
+    def pdf_to_page_inputs(self, pdf_path, pages=None):
+        # yields (kind, content, decision) per page: the page text in tiered mode when the
+        # text layer is good enough, the base64 rendered page otherwise
+        with fitz.open(pdf_path) as pdf_document:
+            for page_num in (range(len(pdf_document)) if pages is None else pages):
+                page = pdf_document.load_page(page_num)
+                decision = {"reason": "vision mode"}
+                if self.extraction_mode == "tiered":
+                    text, decision = self.page_text(page)
+                    if text is not None:
+                        yield PAGE_TEXT, text, {"method": PAGE_TEXT, **decision}
+                        continue
+                yield PAGE_IMAGE, base64.b64encode(self.render_page(page)).decode("utf-8"), {"method": PAGE_IMAGE, **decision}
+    
+    
+    def extract_invoice_data(self, base64_image):
+        return self._create_completion(base64_image).choices[0].message.content
+
+
+    def _create_completion(self, base64_image):
             response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
+                model=self.MODEL,
                 response_format={ "type": "json_object" },
                 messages=[
                     {
                         "role": "system",
-                        "content": system_prompt
+                        "content": SYSTEM_PROMPT
                     },
                     {
                         "role": "user",
                         "content": [
-                            {"type": "text", "text": "extract the data in calendar of eventos and output into JSON "},
-                            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}", "detail": "high"}}
+                            {"type": "text", "text": USER_PROMPT},
+                            {"type": "image_url", "image_url": {"url": f"data:{IMAGE_MIME_TYPES[self.image_format]};base64,{base64_image}", "detail": "high"}}
                         ]
                     }
                 ],
-                temperature=0.0,
+                temperature=self.temperature,
             )
-            return response.choices[0].message.content
+            return response
+
+
+    def _create_text_completion(self, text):
+        # no image and no detail: high tiles, only the page text
+        return self.client.chat.completions.create(
+            model=self.MODEL,
+            response_format={ "type": "json_object" },
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": TEXT_USER_PROMPT + text}
+            ],
+            temperature=self.temperature,
+        )
     
     
-    def extract_from_multiple_pages(self, base64_images, original_filename, output_directory):
-        entire_invoice = []
+    def _extract_page(self, content, kind=PAGE_IMAGE):
+        # returns the page json and the token usage of the call, None when it came from the cache
+        user_prompt = TEXT_USER_PROMPT if kind == PAGE_TEXT else USER_PROMPT
+        key = self.cache.make_key(content, SYSTEM_PROMPT + user_prompt, self.MODEL, self.temperature) if self.cache else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return json.loads(cached), None
 
-        for base64_image in base64_images:
-            invoice_json = self.extract_invoice_data(base64_image)
-            invoice_data = json.loads(invoice_json)
-            entire_invoice.append(invoice_data)
+        for attempt in range(self.max_retries + 1):
+            try:
+                if kind == PAGE_TEXT:
+                    response = self._create_text_completion(content)
+                else:
+                    response = self._create_completion(content)
+                answer = response.choices[0].message.content
+                data = json.loads(answer)
+                if key is not None:
+                    self.cache.put(key, answer)
+                return data, response.usage
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_seconds * 2 ** attempt
+                # a 429 from GitHub Models says how long to wait
+                error_response = getattr(e, "response", None)
+                try:
+                    delay = max(delay, float(error_response.headers.get("retry-after", 0)) if error_response is not None else 0)
+                except ValueError:
+                    pass
+                time.sleep(delay + random.uniform(0, delay / 2))
 
-        # Ensure the output directory exists
-        os.makedirs(output_directory, exist_ok=True)
 
-        # Construct the output file path
-        output_filename = os.path.join(output_directory, original_filename.replace('.pdf', '_extracted.json'))
-        
-        # Save the entire_invoice list as a JSON file
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            json.dump(entire_invoice, f, ensure_ascii=False, indent=4)
-        return output_filename
+    def _submit_page(self, executor, content, kind=PAGE_IMAGE):
+        # blocks while too many pages are queued, so rendering stays just ahead of the
+        # workers instead of holding every page image in memory
+        self._queued.acquire()
+        future = executor.submit(self._extract_page, content, kind)
+        future.add_done_callback(lambda _: self._queued.release())
+        return future
 
 
-    
-    def extract(self):
-        # Print the current working directory
-        for filename in os.listdir(self.path_to_documents)[:3]:
-            file_path = os.path.join(self.path_to_documents, filename)
-            print(f"Extracting data from {file_path}")
-            if os.path.isfile(file_path):
-                base64_images = self.pdf_to_base64_images(file_path)
-                self.extract_from_multiple_pages(base64_images, filename, self.path_to_output)
\ No newline at end of file
+    def extract(self, recursive: bool = False, retry_failed: bool = False):
+        # every pdf in the folder, checkpointed in the output folder so a rerun only does what is left
+        return ExtractionJob(self, self.path_to_documents, self.path_to_output, recursive=recursive).run(retry_failed=retry_failed)
@@ -0,0 +1,200 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import json
+import os
+import threading
+import time
+
+from extraction_manifest import ExtractionManifest, PAGE_DONE, PAGE_FAILED, PAGE_PENDING, file_content_hash
+
+
+# US$ per million input / output tokens, list prices only used for the estimate in the summary
+MODEL_PRICES = {"gpt-4o-mini": (0.15, 0.60), "gpt-4o": (2.50, 10.00)}
+# seconds between manifest checkpoints while pages complete
+CHECKPOINT_SECONDS = 10.0
+
+
+class JobSummary:
+    def __init__(self, model: str):
+        self.model = model
+        self.files_total = 0
+        self.files_skipped = 0
+        self.files_failed = 0
+        self.pages_done = 0
+        self.pages_failed = 0
+        self.pages_cached = 0
+        self.pages_by_method = {}
+        # page statuses of the whole manifest after the run, including earlier runs
+        self.manifest_pages = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def pages_per_minute(self) -> float:
+        return self.pages_done / self.elapsed * 60 if self.elapsed else 0.0
+
+    def cost(self):
+        prices = MODEL_PRICES.get(self.model)
+        if prices is None:
+            return None
+        return (self.prompt_tokens * prices[0] + self.completion_tokens * prices[1]) / 1_000_000
+
+    def __str__(self):
+        cost = self.cost()
+        return (f"files={self.files_total} skipped={self.files_skipped} failed={self.files_failed} "
+                f"pages={self.pages_done} cached_pages={self.pages_cached} failed_pages={self.pages_failed} "
+                f"by_method={self.pages_by_method} manifest_pages={self.manifest_pages} in {self.elapsed:.1f}s "
+                f"({self.pages_per_minute():.1f} pages/min), tokens prompt={self.prompt_tokens} "
+                f"completion={self.completion_tokens}, cost " + (f"~${cost:.4f}" if cost is not None else "unknown"))
+
+
+class ExtractionJob:
+    # Extracts every pdf under source_path into output_path, mirroring its folders.
+    # Progress is checkpointed page by page in an ExtractionManifest next to the
+    # outputs: a rerun skips unchanged files that are done, resumes the pending pages
+    # of interrupted ones and, with retry_failed, extracts only the pages that failed.
+    def __init__(self, extractor, source_path: str, output_path: str, recursive: bool = True, extensions=(".pdf",)):
+        self.extractor = extractor
+        self.source_path = source_path
+        self.output_path = output_path
+        self.recursive = recursive
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.manifest = ExtractionManifest.load(output_path)
+        self._results = {}
+        self._dirty = set()
+        self._last_checkpoint = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _source_files(self):
+        if self.recursive:
+            paths = (os.path.join(root, name) for root, _, names in os.walk(self.source_path) for name in names)
+        else:
+            paths = (os.path.join(self.source_path, name) for name in os.listdir(self.source_path))
+        return sorted(path for path in paths if os.path.isfile(path) and path.lower().endswith(self.extensions))
+
+    def _output_for(self, relative_path: str) -> str:
+        directory, filename = os.path.split(relative_path)
+        return os.path.join(self.output_path, directory, os.path.splitext(filename)[0] + "_extracted.json")
+
+    def _plan(self, retry_failed: bool, summary: JobSummary):
+        work = []
+        for path in self._source_files():
+            relative_path = os.path.relpath(path, self.source_path)
+            summary.files_total += 1
+            content_hash = file_content_hash(path)
+            if self.manifest.is_current(relative_path, content_hash):
+                pages = self.manifest.pages_to_run(relative_path, retry_failed)
+                if not pages:
+                    # failed pages left alone without retry_failed still leave the file failed
+                    if self.manifest.files[relative_path]["status"] == PAGE_FAILED:
+                        summary.files_failed += 1
+                    else:
+                        summary.files_skipped += 1
+                    continue
+                with open(self.manifest.files[relative_path]["output"], "r", encoding="utf-8") as f:
+                    self._results[relative_path] = json.load(f)
+            else:
+                output = self._output_for(relative_path)
+                try:
+                    page_count = self.extractor.page_count(path)
+                except Exception as e:
+                    self.manifest.start(relative_path, content_hash, output, 0)
+                    self.manifest.record_file_error(relative_path, str(e))
+                    summary.files_failed += 1
+                    print(f"Could not read {path}: {e}")
+                    continue
+                self.manifest.start(relative_path, content_hash, output, page_count)
+                self._results[relative_path] = [None] * page_count
+                if not page_count:
+                    # nothing to extract, the empty output makes the file current for the next runs
+                    self._write_results(relative_path)
+                    continue
+                pages = list(range(page_count))
+            work.append((path, relative_path, pages))
+        self.manifest.save()
+        return work
+
+    def _page_done(self, relative_path: str, page_number: int, decision: dict, summary: JobSummary, total_pages: int, future):
+        error = future.exception()
+        with self._lock:
+            if error is None:
+                data, usage = future.result()
+                self._results[relative_path][page_number] = data
+                self.manifest.record_page(relative_path, page_number, usage=usage, decision=decision)
+                summary.pages_done += 1
+                if usage is None:
+                    summary.pages_cached += 1
+                else:
+                    summary.prompt_tokens += usage.prompt_tokens
+                    summary.completion_tokens += usage.completion_tokens
+            else:
+                self.manifest.record_page(relative_path, page_number, error=str(error), decision=decision)
+                summary.pages_failed += 1
+            # a file's output is written once all its pages are in, the manifest (the whole
+            # tree) only every CHECKPOINT_SECONDS, after the outputs of the pages it lists
+            if self.manifest.files[relative_path]["status"] != PAGE_PENDING:
+                self._write_results(relative_path)
+                self._dirty.discard(relative_path)
+            else:
+                self._dirty.add(relative_path)
+            if time.perf_counter() - self._last_checkpoint >= CHECKPOINT_SECONDS:
+                self._checkpoint()
+            finished = summary.pages_done + summary.pages_failed
+            elapsed = time.perf_counter() - summary.started
+            print(f"[{finished}/{total_pages}] {relative_path} page {page_number + 1} {decision['method']} ({decision['reason']}) "
+                  f"{'failed: ' + str(error) if error else 'ok'} ({finished / elapsed * 60:.1f} pages/min)")
+
+    def _checkpoint(self):
+        # the outputs keep the pages done so far (None for the rest), the manifest says which
+        for relative_path in self._dirty:
+            self._write_results(relative_path)
+        self._dirty.clear()
+        self.manifest.save()
+        self._last_checkpoint = time.perf_counter()
+
+    def _write_results(self, relative_path: str):
+        output = self.manifest.files[relative_path]["output"]
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        tmp_path = output + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._results[relative_path], f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, output)
+
+    def run(self, retry_failed: bool = False) -> JobSummary:
+        summary = JobSummary(self.extractor.MODEL)
+        work = self._plan(retry_failed, summary)
+        total_pages = sum(len(pages) for _, _, pages in work)
+        print(f"{len(work)} files and {total_pages} pages to extract, {summary.files_skipped} files already done, "
+              f"{summary.files_failed} failed")
+
+        # pages of every file share one pool, so a folder takes about as long as its slowest pages
+        try:
+            with ThreadPoolExecutor(max_workers=self.extractor.max_in_flight, thread_name_prefix="extract") as executor:
+                for path, relative_path, pages in work:
+                    print(f"Extracting data from {path}")
+                    inputs = self.extractor.pdf_to_page_inputs(path, pages)
+                    for i, page_number in enumerate(pages):
+                        try:
+                            kind, content, decision = next(inputs)
+                        except Exception as e:
+                            # rendering failed part way, the pages not sent are marked failed
+                            print(f"Could not render {path}: {e}")
+                            with self._lock:
+                                for failed_page in pages[i:]:
+                                    self.manifest.record_page(relative_path, failed_page, error=str(e))
+                                    summary.pages_failed += 1
+                                self._dirty.add(relative_path)
+                                self._checkpoint()
+                            break
+                        summary.pages_by_method[kind] = summary.pages_by_method.get(kind, 0) + 1
+                        future = self.extractor._submit_page(executor, content, kind)
+                        future.add_done_callback(partial(self._page_done, relative_path, page_number, decision, summary, total_pages))
+        finally:
+            # also when interrupted, so a rerun resumes from the pages completed so far
+            with self._lock:
+                self._checkpoint()
+        summary.files_failed += sum(1 for _, relative_path, _ in work if self.manifest.files[relative_path]["status"] != PAGE_DONE)
+        summary.manifest_pages = self.manifest.counts()
+        summary.elapsed = time.perf_counter() - summary.started
+        return summary
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+
+
+MANIFEST_FILE = "extraction_manifest.json"
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+PAGE_PENDING = "pending"
+PAGE_DONE = "done"
+PAGE_FAILED = "failed"
+
+
+def file_content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionManifest:
+    # Keeps, per source file (relative to the source folder), its content hash, the
+    # output json it is written to and the status of every page, so an interrupted or
+    # partly failed run can be resumed without paying again for the pages already done.
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self.files = {}
+
+    @classmethod
+    def load(cls, output_path: str):
+        manifest = cls(os.path.join(output_path, MANIFEST_FILE))
+        if os.path.exists(manifest.manifest_path):
+            with open(manifest.manifest_path, "r", encoding="utf-8") as f:
+                manifest.files = json.load(f).get("files", {})
+        return manifest
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "files": self.files}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def start(self, relative_path: str, content_hash: str, output: str, page_count: int):
+        # a new or changed file starts over with every page pending, one without pages is done
+        self.files[relative_path] = {
+            "hash": content_hash,
+            "output": output,
+            "status": PAGE_PENDING if page_count else PAGE_DONE,
+            "error": None,
+            "pages": [{"status": PAGE_PENDING, "error": None, "prompt_tokens": 0, "completion_tokens": 0} for _ in range(page_count)],
+        }
+        return self.files[relative_path]
+
+    def is_current(self, relative_path: str, content_hash: str) -> bool:
+        # same content, readable (files that could not be opened have no pages and failed),
+        # and its output (holding the pages already done) still there
+        entry = self.files.get(relative_path)
+        return (bool(entry) and entry["hash"] == content_hash and (bool(entry["pages"]) or entry["status"] == PAGE_DONE)
+                and os.path.exists(entry["output"]))
+
+    def pages_to_run(self, relative_path: str, retry_failed: bool = False):
+        # pending pages are always run again, failed ones only when asked to
+        statuses = (PAGE_PENDING, PAGE_FAILED) if retry_failed else (PAGE_PENDING,)
+        return [i for i, page in enumerate(self.files[relative_path]["pages"]) if page["status"] in statuses]
+
+    def record_page(self, relative_path: str, page_number: int, error: str = None, usage=None, decision: dict = None):
+        entry = self.files[relative_path]
+        page = entry["pages"][page_number]
+        page["status"] = PAGE_FAILED if error else PAGE_DONE
+        page["error"] = error
+        if decision is not None:
+            # how the page was read (text layer or image) and why, the per page decision log
+            page["decision"] = decision
+        if usage is not None:
+            page["prompt_tokens"] = usage.prompt_tokens
+            page["completion_tokens"] = usage.completion_tokens
+        statuses = {page["status"] for page in entry["pages"]}
+        if PAGE_PENDING not in statuses:
+            entry["status"] = PAGE_FAILED if PAGE_FAILED in statuses else PAGE_DONE
+
+    def record_file_error(self, relative_path: str, error: str):
+        # the file could not be opened, it is tried again on the next run
+        entry = self.files[relative_path]
+        entry["status"] = PAGE_FAILED
+        entry["error"] = error
+
+    def counts(self) -> dict:
+        result = {PAGE_PENDING: 0, PAGE_DONE: 0, PAGE_FAILED: 0}
+        for entry in self.files.values():
+            for page in entry["pages"]:
+                result[page["status"]] += 1
+        return result
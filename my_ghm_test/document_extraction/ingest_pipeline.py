@@ -1,4 +1,5 @@
 from document_data_extracter import DocumentDataExtraction
+import argparse
 import os
 
 def main():
@@ -6,12 +7,29 @@ def main():
 
     current_directory = os.path.dirname(__file__)
 
-    read_path= os.path.join(current_directory, "./dataEvents/source")
-    write_path= os.path.join(current_directory, "./dataEvents/extracted")
+    parser = argparse.ArgumentParser(description="Extract the pdfs of a folder into json, resuming from the checkpoint manifest in the output folder")
+    parser.add_argument("--source", default=os.path.join(current_directory, "./dataEvents/source"), help="folder with the pdfs to extract")
+    parser.add_argument("--output", default=os.path.join(current_directory, "./dataEvents/extracted"), help="folder for the json files and the manifest")
+    parser.add_argument("--model", default=GPT_MODEL)
+    parser.add_argument("--recursive", action="store_true", help="also extract the pdfs in subfolders, mirroring them in the output folder")
+    parser.add_argument("--retry-failed", action="store_true", help="extract again the pages that failed in earlier runs")
+    parser.add_argument("--max-in-flight", type=int, default=8, help="maximum vision requests in flight")
+    parser.add_argument("--dpi", type=int, default=72, help="resolution the pages are rendered at")
+    parser.add_argument("--image-format", choices=["png", "jpeg"], default="png")
+    parser.add_argument("--mode", choices=["vision", "tiered"], default="vision", help="tiered reads the pdf text layer first and only sends the pages without enough text as images")
+    parser.add_argument("--min-text-chars", type=int, default=200, help="in tiered mode, pages with less text than this are sent as images")
+    parser.add_argument("--cache-path", default=os.path.join(current_directory, "page_cache.sqlite3"), help="cache of the model answer per page image, prompt, model and temperature")
+    parser.add_argument("--no-cache", action="store_true", help="send every page to the model, without reading or writing the page cache")
+    args = parser.parse_args()
 
-    data_extractor = DocumentDataExtraction(read_path, write_path, GPT_MODEL)
-    data_extractor.extract()
+    data_extractor = DocumentDataExtraction(args.source, args.output, args.model, dpi=args.dpi, image_format=args.image_format,
+                                            max_in_flight=args.max_in_flight, cache_path=None if args.no_cache else args.cache_path,
+                                            extraction_mode=args.mode, min_text_chars=args.min_text_chars)
+    summary = data_extractor.extract(recursive=args.recursive, retry_failed=args.retry_failed)
+    print(summary)
+    if data_extractor.cache:
+        print(f"Page cache: {data_extractor.cache.stats()}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class PageCache:
+    # Content addressed store of the raw json the model returned for a page, in a local
+    # SQLite file. The key covers the page content (the rendered image, or its text layer
+    # in tiered mode), the prompts, the model and the temperature, so changing any of
+    # them misses instead of returning stale data.
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, response TEXT NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(page_content: str, prompt: str, model: str, temperature: float) -> str:
+        content_hash = hashlib.sha256(page_content.encode("utf-8")).hexdigest()
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{content_hash}\0{prompt_hash}\0{model}\0{temperature}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM pages WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE pages SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return row[0]
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO pages (key, response, last_used) VALUES (?, ?, ?)", (key, response, time.time()))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()
+        if count > self.max_entries:
+            self._conn.execute("DELETE FROM pages WHERE key IN (SELECT key FROM pages ORDER BY last_used LIMIT ?)", (count - self.max_entries,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
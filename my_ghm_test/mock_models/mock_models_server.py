@@ -0,0 +1,309 @@
+"""Local stand-in for the GitHub Models endpoint, for offline load and latency tests.
+
+Serves the OpenAI compatible routes the samples and my_ghm_test use (chat completions
+with streaming, JSON mode and image inputs, embeddings, the azure-ai-inference /info
+route) with configurable latency, 429 injection and RPM/TPM limits. Point the clients
+at it with:
+
+    python mock_models_server.py --port 8000 --rpm 60 --latency lognormal:400:0.5
+    export GITHUB_MODELS_ENDPOINT=http://127.0.0.1:8000
+"""
+
+import argparse
+import base64
+import collections
+import hashlib
+import json
+import math
+import random
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+IMAGE_TOKENS = {"low": 85, "high": 765, "auto": 765}
+EMBEDDING_DIMENSIONS = {"text-embedding-3-large": 3072, "text-embedding-3-small": 1536, "text-embedding-ada-002": 1536}
+
+
+class LatencyModel:
+    # "fixed:ms", "uniform:low_ms:high_ms", "normal:mean_ms:stddev_ms" or "lognormal:median_ms:sigma"
+    def __init__(self, spec: str, rng: random.Random):
+        kind, *values = spec.split(":")
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Invalid latency distribution: {spec}")
+        self.kind = kind
+        self.values = [float(value) for value in values]
+        self.rng = rng
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            milliseconds = self.values[0]
+        elif self.kind == "uniform":
+            milliseconds = self.rng.uniform(*self.values)
+        elif self.kind == "normal":
+            milliseconds = self.rng.gauss(*self.values)
+        else:
+            milliseconds = self.values[0] * math.exp(self.rng.gauss(0.0, self.values[1]))
+        return max(0.0, milliseconds) / 1000
+
+
+class RateLimiter:
+    # sliding 60 second window over requests and tokens, like the per-minute service limits
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = collections.deque()
+        self._tokens = collections.deque()
+        self._lock = threading.Lock()
+
+    def admit(self, tokens: int):
+        # returns 0 when admitted, otherwise the seconds until the request would fit
+        now = time.monotonic()
+        with self._lock:
+            for window in (self._requests, self._tokens):
+                while window and window[0][0] <= now - 60:
+                    window.popleft()
+            if self.rpm and len(self._requests) >= self.rpm:
+                return self._requests[0][0] + 60 - now
+            if self.tpm and sum(count for _, count in self._tokens) + tokens > self.tpm and self._tokens:
+                return self._tokens[0][0] + 60 - now
+            self._requests.append((now, 1))
+            self._tokens.append((now, tokens))
+            return 0
+
+
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.rng_lock = threading.Lock()
+        self.latency = LatencyModel(args.latency, self.rng)
+        self.token_latency = LatencyModel(args.token_latency, self.rng)
+        self.limiter = RateLimiter(args.rpm, args.tpm)
+        self.stats = collections.Counter()
+        self.stats_lock = threading.Lock()
+
+    def count(self, **values):
+        with self.stats_lock:
+            self.stats.update(values)
+
+    def sample_latency(self, model: LatencyModel) -> float:
+        with self.rng_lock:
+            return model.sample()
+
+    def inject_429(self) -> bool:
+        with self.rng_lock:
+            return self.rng.random() < self.args.error_rate
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
+def message_tokens(messages):
+    # text is estimated at 4 characters per token, images use the fixed per-detail cost
+    tokens, images = 0, 0
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, str):
+            tokens += estimate_tokens(content) + 4
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                tokens += estimate_tokens(part.get("text", ""))
+            elif part.get("type") in ("image_url", "image"):
+                images += 1
+                tokens += IMAGE_TOKENS.get((part.get("image_url") or {}).get("detail", "auto"), 765)
+        tokens += 4
+    return tokens, images
+
+
+def last_user_text(messages) -> str:
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        content = message.get("content") or ""
+        if isinstance(content, str):
+            return content
+        return " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return ""
+
+
+def completion_text(state: MockState, request: dict, images: int) -> str:
+    question = " ".join(last_user_text(request.get("messages", [])).split())[:120]
+    if (request.get("response_format") or {}).get("type") == "json_object":
+        return json.dumps({"mock": True, "model": request.get("model"), "images": images, "question": question}, ensure_ascii=False)
+    words = ["respuesta", "simulada", "del", "servidor", "local"]
+    filler = " ".join(words[i % len(words)] for i in range(state.args.completion_words))
+    return f"{filler}. Pregunta: {question}" if question else filler
+
+
+def embedding_vector(text: str, dimensions: int):
+    # same text, same vector, so caches and benchmarks behave like against the real service
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: MockState = None
+
+    def log_message(self, format, *args):
+        if self.state.args.verbose:
+            super().log_message(format, *args)
+
+    def _route(self) -> str:
+        path = self.path.split("?", 1)[0].rstrip("/")
+        for prefix in ("/v1", "/openai"):
+            if path.startswith(prefix + "/"):
+                path = path[len(prefix):]
+        return path
+
+    def _send_json(self, status: int, body: dict, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _reject(self, retry_after: float, reason: str):
+        self.state.count(rate_limited=1)
+        seconds = max(1, math.ceil(retry_after))
+        self._send_json(429, {"error": {"code": "RateLimitReached", "message": f"{reason}, retry after {seconds} seconds"}},
+                        {"Retry-After": str(seconds), "x-ms-retry-after-ms": str(int(retry_after * 1000))})
+
+    def _admit(self, tokens: int) -> bool:
+        self.state.count(requests=1)
+        if self.state.inject_429():
+            self._reject(self.state.args.retry_after, "Injected rate limit")
+            return False
+        wait = self.state.limiter.admit(tokens)
+        if wait:
+            self._reject(wait, "Rate limit of the mock server exceeded")
+            return False
+        self.state.count(prompt_tokens=tokens)
+        return True
+
+    def do_GET(self):
+        route = self._route()
+        if route == "/info":
+            self._send_json(200, {"model_name": "mock", "model_type": "chat-completion", "model_provider_name": "mock"})
+        elif route == "/stats":
+            with self.state.stats_lock:
+                self._send_json(200, dict(self.state.stats))
+        elif route == "/models":
+            self._send_json(200, {"object": "list", "data": [{"id": name, "object": "model"} for name in EMBEDDING_DIMENSIONS]})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown route {self.path}"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Body is not valid json"}})
+            return
+        route = self._route()
+        if route == "/chat/completions":
+            self._chat(request)
+        elif route == "/embeddings":
+            self._embeddings(request)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown route {self.path}"}})
+
+    def _chat(self, request: dict):
+        prompt_tokens, images = message_tokens(request.get("messages", []))
+        if not self._admit(prompt_tokens):
+            return
+        time.sleep(self.state.sample_latency(self.state.latency))
+        text = completion_text(self.state, request, images)
+        completion_tokens = estimate_tokens(text)
+        self.state.count(completion_tokens=completion_tokens, images=images, chat=1)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        response_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = request.get("model", "mock")
+        if not request.get("stream"):
+            self._send_json(200, {"id": response_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                                  "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                                  "usage": usage})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(delta: dict, finish_reason=None, extra=None):
+            chunk = {"id": response_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **(extra or {})}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        send({"role": "assistant", "content": ""})
+        pieces = text.split(" ")
+        for i, piece in enumerate(pieces):
+            send({"content": piece if i == 0 else " " + piece})
+            time.sleep(self.state.sample_latency(self.state.token_latency))
+        send({}, "stop", {"usage": usage} if (request.get("stream_options") or {}).get("include_usage") else None)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _embeddings(self, request: dict):
+        inputs = request.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        # token id arrays are accepted too, they are hashed as their text form
+        texts = [text if isinstance(text, str) else json.dumps(text) for text in inputs]
+        tokens = sum(estimate_tokens(text) for text in texts)
+        if not self._admit(tokens):
+            return
+        time.sleep(self.state.sample_latency(self.state.latency))
+        model = request.get("model", "text-embedding-3-small")
+        dimensions = request.get("dimensions") or EMBEDDING_DIMENSIONS.get(model, 1536)
+        data = []
+        for index, text in enumerate(texts):
+            vector = embedding_vector(text, dimensions)
+            if request.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{dimensions}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        self.state.count(embedding_inputs=len(texts), embeddings=1)
+        self._send_json(200, {"object": "list", "data": data, "model": model, "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI compatible stand-in for the GitHub Models endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="fixed:0", help="time to first byte: fixed:ms, uniform:lo:hi, normal:mean:sd or lognormal:median:sigma")
+    parser.add_argument("--token-latency", default="fixed:0", help="delay between streamed chunks, same syntax as --latency")
+    parser.add_argument("--completion-words", type=int, default=40, help="length of the canned text answers")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before answering 429 (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="prompt tokens per minute before answering 429 (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with an injected 429")
+    parser.add_argument("--retry-after", type=float, default=2.0, help="Retry-After seconds of the injected 429s")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the latency and error injection random numbers")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    MockHandler.state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    print(f"Mock models server on http://{args.host}:{args.port}, set GITHUB_MODELS_ENDPOINT to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
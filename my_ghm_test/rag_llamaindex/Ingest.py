@@ -1,17 +1,33 @@
-from embed_and_query import RagBasedBot, Mode
+from embed_and_query import RagBasedBot, Mode, VectorBackend
+import argparse
 import os
 from model_data import EmbedderModelOpenAI
 
 def main():
-    
+    parser = argparse.ArgumentParser(description="Embed the documents folder into the index store")
+    parser.add_argument("--incremental", action="store_true", help="only embed new or changed files and drop the vectors of deleted ones")
+    parser.add_argument("--recursive", action="store_true", help="also read the documents in subfolders")
+    parser.add_argument("--workers", type=int, default=0, help="parse files in this many worker processes (0 parses them in this process)")
+    parser.add_argument("--concurrency", type=int, default=4, help="maximum embedding requests in flight (0 sends them one after another)")
+    parser.add_argument("--file-timeout", type=float, default=300.0, help="seconds a worker may spend parsing one file")
+    parser.add_argument("--window-nodes", type=int, default=0, help="stream files through chunking, embedding and upsert in windows of this many nodes, checkpointing whenever the nodes committed since the last checkpoint reach the number already persisted")
+    parser.add_argument("--data-path", help="documents folder, default ./data; with DataSources and --recursive each subfolder becomes a source area for routing")
+    parser.add_argument("--vector-store", choices=[VectorBackend.CHROMA.value, VectorBackend.NUMPY.value], default=os.getenv("RAG_VECTOR_STORE", VectorBackend.CHROMA.value))
+    args = parser.parse_args()
+
     current_directory = os.path.dirname(__file__)
-    data_path = os.path.join(current_directory, "./data")
+    data_path = args.data_path or os.path.join(current_directory, "./data")
     data_base_path = os.path.join(current_directory, "./index_store")
 
-    embedding_model = EmbedderModelOpenAI(model="text-embedding-3-large")
-    bot = RagBasedBot(Mode.INGEST, data_path, data_base_path, model_for_embedding=embedding_model)
-    bot.index_data()
+    cache_path = os.path.join(data_base_path, "embedding_cache.sqlite3")
+
+    embedding_model = EmbedderModelOpenAI(model="text-embedding-3-large", cache_path=cache_path, max_concurrency=args.concurrency)
+    bot = RagBasedBot(Mode.INGEST, data_path, data_base_path, model_for_embedding=embedding_model, vector_backend=VectorBackend(args.vector_store))
+    bot.index_data(rec_flag=args.recursive, incremental=args.incremental, num_workers=args.workers, file_timeout=args.file_timeout, window_nodes=args.window_nodes)
+    print(f"Embedding cache: {embedding_model.cache.stats()}")
+    if embedding_model.dispatcher:
+        print(f"Embedding requests: {embedding_model.dispatcher.stats()}")
     
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
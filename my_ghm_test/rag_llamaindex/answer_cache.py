@@ -0,0 +1,131 @@
+from collections import OrderedDict
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+
+_PUNCTUATION = re.compile(r"[¿?¡!.,;:\"'()]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    prompt = unicodedata.normalize("NFC", prompt).lower()
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", prompt)).strip()
+
+
+class CachedAnswer:
+    def __init__(self, answer: str, embedding, created: float):
+        self.answer = answer
+        self.embedding = embedding
+        self.created = created
+
+
+class AnswerCache:
+    # Two levels in front of retrieval + chat: exact matches on the normalized prompt,
+    # then prompts whose query embedding is within similarity_threshold (cosine) of a
+    # cached one. Entries expire after ttl_seconds, the least recently used ones are
+    # evicted past max_entries and everything is dropped when the index version changes.
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600.0, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def _is_fresh(self, entry: CachedAnswer, now: float) -> bool:
+        return now - entry.created <= self.ttl_seconds
+
+    def lookup(self, prompt: str, version=None, embed_query=None):
+        # returns (answer, query_embedding); embed_query is only called when the exact
+        # level misses, and its result is handed back so retrieval doesn't embed again
+        answer = self._lookup_exact(prompt, version)
+        if answer is not None:
+            return answer, None
+        if embed_query is None:
+            with self._lock:
+                self.misses += 1
+            return None, None
+        embedding = embed_query(prompt)
+        return self._lookup_similar(embedding, version), embedding
+
+    async def alookup(self, prompt: str, version=None, aembed_query=None):
+        answer = self._lookup_exact(prompt, version)
+        if answer is not None:
+            return answer, None
+        if aembed_query is None:
+            with self._lock:
+                self.misses += 1
+            return None, None
+        embedding = await aembed_query(prompt)
+        return self._lookup_similar(embedding, version), embedding
+
+    def _lookup_exact(self, prompt: str, version):
+        key = normalize_prompt(prompt)
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(entry, time.time()):
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry.answer
+            if entry is not None:
+                del self._entries[key]
+        return None
+
+    def _lookup_similar(self, embedding, version):
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            for key in [key for key, entry in self._entries.items() if not self._is_fresh(entry, now)]:
+                del self._entries[key]
+            candidates = [(key, entry) for key, entry in self._entries.items() if entry.embedding is not None]
+            if candidates:
+                similarities = np.stack([entry.embedding for _, entry in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.semantic_hits += 1
+                    return entry.answer
+            self.misses += 1
+        return None
+
+    def store(self, prompt: str, embedding, answer: str, version=None):
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embedding /= np.linalg.norm(embedding) or 1.0
+        key = normalize_prompt(prompt)
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = CachedAnswer(answer, embedding, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,69 @@
+import hashlib
+import re
+
+from token_counting import count_tokens
+
+
+CONTEXT_SEPARATOR = "\n------\n"
+_WORD = re.compile(r"\w+")
+
+
+def _shingles(text: str, size: int = 3):
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class PackedContext:
+    def __init__(self, fragments, text: str, used_tokens: int, input_tokens: int, duplicates: int, over_budget: int):
+        self.fragments = fragments
+        self.text = text
+        self.used_tokens = used_tokens
+        self.input_tokens = input_tokens
+        self.duplicates = duplicates
+        self.over_budget = over_budget
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.input_tokens - self.used_tokens
+
+    def report(self) -> str:
+        return (f"context {self.used_tokens} tokens from {len(self.fragments)} fragments, {self.tokens_saved} tokens saved "
+                f"({self.duplicates} duplicates, {self.over_budget} over budget)")
+
+
+def pack_context(fragments, token_budget: int = 3000, tokenizer=None, near_duplicate_threshold: float = 0.8,
+                 separator: str = CONTEXT_SEPARATOR) -> PackedContext:
+    # Highest scoring fragments first; exact copies (same text after whitespace and case
+    # normalization, e.g. the same file under data/ and DataSources/) and near copies
+    # (overlapping chunks, shingle jaccard >= near_duplicate_threshold) are dropped, and
+    # fragments that no longer fit in token_budget are skipped. token_budget=0 means no limit.
+    ranked = sorted(fragments, key=lambda fragment: fragment.score if fragment.score is not None else 0.0, reverse=True)
+    separator_tokens = count_tokens(separator, tokenizer)
+    kept, kept_shingles, seen = [], [], set()
+    used_tokens = input_tokens = duplicates = over_budget = 0
+    for fragment in ranked:
+        text = fragment.text
+        tokens = count_tokens(text, tokenizer)
+        input_tokens += tokens + (separator_tokens if input_tokens else 0)
+        digest = hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+        shingles = _shingles(text)
+        if digest in seen or any(_jaccard(shingles, other) >= near_duplicate_threshold for other in kept_shingles):
+            duplicates += 1
+            continue
+        needed = tokens + (separator_tokens if kept else 0)
+        if token_budget and used_tokens + needed > token_budget:
+            over_budget += 1
+            continue
+        seen.add(digest)
+        kept_shingles.append(shingles)
+        kept.append(fragment)
+        used_tokens += needed
+    return PackedContext(kept, separator.join(fragment.text for fragment in kept), used_tokens, input_tokens, duplicates, over_budget)
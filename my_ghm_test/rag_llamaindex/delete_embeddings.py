@@ -1,4 +1,4 @@
-from embed_and_query import RagBasedBot, Mode
+from embed_and_query import RagBasedBot, Mode, VectorBackend
 from model_data import EmbedderModelOpenAI
 import os
 
@@ -8,7 +8,8 @@ def main():
     data_path = os.path.join(current_directory, "./data")
     data_base_path = os.path.join(current_directory, "./index_store")
     embedding_model = EmbedderModelOpenAI(model="text-embedding-3-large")
-    RagBasedBot(mode=Mode.CLEANUP, data_path=data_path, database_path=data_base_path, model_for_embedding= embedding_model)
+    vector_backend = VectorBackend(os.getenv("RAG_VECTOR_STORE", VectorBackend.CHROMA.value))
+    RagBasedBot(mode=Mode.CLEANUP, data_path=data_path, database_path=data_base_path, model_for_embedding= embedding_model, vector_backend=vector_backend)
 
 
     
@@ -1,45 +1,126 @@
-from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
 from llama_index.core import Settings
+from llama_index.core import load_index_from_storage
+from llama_index.core.ingestion import run_transformations
 from llama_index.core.llms import ChatMessage
+from llama_index.core.schema import QueryBundle
 from model_data import Model
+from ingest_manifest import IngestManifest
+from parallel_loader import ParallelDocumentLoader
+from streaming_ingest import prefetch, IngestWindow, IngestProgress, CheckpointSchedule
+from keyword_index import KeywordIndex, HybridRetriever, KEYWORD_INDEX_FILE
+from ingest_manifest import MANIFEST_FILE, MANIFEST_VERSION
+from answer_cache import AnswerCache
+from context_packing import pack_context
+from reranking import Reranker, RerankingRetriever
+from instrumentation import Instrumentation, NOOP_TRACE
+from token_counting import count_tokens
+from partition_routing import QueryRouter, SOURCE_AREA_KEY, area_filters, tag_documents
 
+import asyncio
 import logging
+import os
 import sys
+import time
 
-import chromadb
-from llama_index.vector_stores.chroma import ChromaVectorStore
 from llama_index.core import StorageContext
 from enum import Enum
-from llama_index.llms.azure_inference import AzureAICompletionsModel
+
+# written by StorageContext.persist next to the vector store, removed with it on cleanup
+STORAGE_CONTEXT_FILES = ("docstore.json", "index_store.json", "graph_store.json", "image__vector_store.json")
+
 
 class Mode(Enum):
     INGEST = "ingest"
     RETRIEVE = "retrieve"
     CLEANUP = "cleanup"
+
+
+class VectorBackend(Enum):
+    CHROMA = "chroma"
+    NUMPY = "numpy"
+    # read-only, memory-mapped single file written by index_snapshot.py export
+    SNAPSHOT = "snapshot"
+
+
+class RetrievalMode(Enum):
+    VECTOR = "vector"
+    HYBRID = "hybrid"
+    KEYWORD = "keyword"
     
     
+class StreamedAnswer:
+    # Timings and pieces of one streamed answer, shared by the sync and async paths.
+    # Created once retrieval is done, so its creation marks the retrieval time.
+    def __init__(self, started: float, trace=NOOP_TRACE):
+        self.started = started
+        self.trace = trace
+        self.retrieval_seconds = time.perf_counter() - started
+        self.first_token_seconds = None
+        self.parts = []
+
+    def add(self, delta: str) -> str:
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.perf_counter() - self.started
+            self.trace.set(first_token_seconds=self.first_token_seconds)
+        self.parts.append(delta)
+        return delta
+
+    @property
+    def answer(self) -> str:
+        return "".join(self.parts)
+
+    def timings(self, cached: bool = False) -> dict:
+        # a cached answer arrives whole right after the lookup
+        first_token_seconds = self.retrieval_seconds if cached else self.first_token_seconds
+        return {"retrieval_seconds": self.retrieval_seconds, "first_token_seconds": first_token_seconds,
+                "total_seconds": time.perf_counter() - self.started}
+
+
 class RagBasedBot:
     query_model = None
     embedding_model = None
     db_client = None
-    def __init__(self, mode : Mode, data_path: str, database_path:str, model_for_query:Model = None, model_for_embedding:Model = None):
+    last_timings = None
+    last_ingest_progress = None
+    # nodes handed to the embedding model per call, the model does its own batching
+    insert_batch_size = 2048
+    def __init__(self, mode : Mode, data_path: str, database_path:str, model_for_query:Model = None, model_for_embedding:Model = None, vector_backend: VectorBackend = VectorBackend.CHROMA, vector_store_options: dict = None,
+                 retrieval_mode: RetrievalMode = RetrievalMode.VECTOR, keyword_weight: float = 0.5, similarity_top_k: int = 2,
+                 answer_cache: AnswerCache = None, context_token_budget: int = 3000,
+                 reranker: Reranker = None, instrumentation: Instrumentation = None, router: QueryRouter = None):
         self.query_model = model_for_query
         self.embedding_model = model_for_embedding
+        self.vector_backend = vector_backend
+        self.retrieval_mode = retrieval_mode
+        self.keyword_weight = keyword_weight
+        self.similarity_top_k = similarity_top_k
+        self.answer_cache = answer_cache
+        self.context_token_budget = context_token_budget
+        self.reranker = reranker
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        self.router = router
+        self.vector_store_options = vector_store_options
         
         try:
             if not isinstance(mode, Mode):
                 raise ValueError(f"Invalid mode: {mode}. Expected one of: {[m.value for m in Mode]}")
             
-            self.path_to_documents = data_path
+            # absolute, so the ingest manifest and the file_path metadata don't depend on the working directory
+            self.path_to_documents = os.path.abspath(data_path)
             self.db_path = database_path
+            self._keyword_index = None
             
+            if self.vector_backend == VectorBackend.SNAPSHOT and mode != Mode.RETRIEVE:
+                raise ValueError("The snapshot backend is read-only, ingest or clean up the chroma or numpy store and export a new snapshot")
+
             if self.query_model != None and mode == Mode.RETRIEVE:
                 self.query_model.init_models()
             
             if self.embedding_model == None:
                 raise ValueError("Embedding model is required")
-            else:  
+            elif mode != Mode.CLEANUP:
+                # cleanup never embeds anything, so it skips loading the embedding client
                 self.embedding_model.init_models()
         
             if mode == Mode.INGEST:
@@ -56,51 +137,427 @@ class RagBasedBot:
             sys.exit(1)
             
         
-    def _init_vector_store(self):
+    @property
+    def keyword_index(self) -> KeywordIndex:
+        # loaded on first use: ingest and keyword/hybrid retrieval need it, vector-only
+        # retrieval never parses the node texts it holds
+        if self._keyword_index is None:
+            self._keyword_index = KeywordIndex.load(self.db_path)
+        return self._keyword_index
+
+    # each backend imports its client only when it is selected
+    def _create_vector_store(self):
+        if self.vector_backend == VectorBackend.SNAPSHOT:
+            from index_snapshot import SnapshotVectorStore
+            return SnapshotVectorStore(self._snapshot_path())
+        if self.vector_backend == VectorBackend.NUMPY:
+            from numpy_vector_store import NumpyVectorStore, vector_store_options_from_env
+            options = self.vector_store_options if self.vector_store_options is not None else vector_store_options_from_env()
+            return NumpyVectorStore(os.path.join(self.db_path, "numpy_store"), **options)
+        import chromadb
+        from llama_index.vector_stores.chroma import ChromaVectorStore
+
         self.db_client = chromadb.PersistentClient(path=self.db_path)
         self.chroma_collection = self.db_client.get_or_create_collection("quickstart")
-        vector_store = ChromaVectorStore(chroma_collection=self.chroma_collection)
+        return ChromaVectorStore(chroma_collection=self.chroma_collection)
+
+    def _init_vector_store(self):
+        vector_store = self._create_vector_store()
         self.storage_context = StorageContext.from_defaults(vector_store=vector_store)
 
     # usar codigo de ejemplo de aca https://colab.research.google.com/github/run-llama/llama_index/blob/main/docs/docs/examples/vector_stores/ChromaIndexDemo.ipynb#scrollTo=9c3a56a5
     def _delete_embeddings(self):
-        self.db_client = chromadb.PersistentClient(path=self.db_path)
-        self.db_client.delete_collection("quickstart")
+        self._reset_vector_store()
+        # the docstore would otherwise keep the ref docs and hashes of the deleted vectors
+        for name in STORAGE_CONTEXT_FILES:
+            path = os.path.join(self.db_path, name)
+            if os.path.exists(path):
+                os.remove(path)
+        manifest = IngestManifest.load(self.db_path)
+        manifest.clear()
+        manifest.save()
+        self.keyword_index.clear()
+        self.keyword_index.save()
 
-        
-    def index_data(self, rec_flag: bool = False):
-        documents = SimpleDirectoryReader(self.path_to_documents, recursive=rec_flag).load_data()
-        self.index = VectorStoreIndex.from_documents(documents, self.storage_context, insert_batch_size=150)
+    def _reset_vector_store(self):
+        # drops every stored vector, for cleanup and for a full ingest, which would
+        # otherwise add a second copy of every chunk
+        if self.vector_backend == VectorBackend.NUMPY:
+            vector_store = self._create_vector_store()
+            vector_store.clear()
+            vector_store.persist()
+        else:
+            import chromadb
+
+            self.db_client = chromadb.PersistentClient(path=self.db_path)
+            try:
+                self.db_client.delete_collection("quickstart")
+            except ValueError:
+                # nothing ingested yet
+                pass
+
+    def index_data(self, rec_flag: bool = False, incremental: bool = False, num_workers: int = 0, file_timeout: float = 300.0, window_nodes: int = 0):
+        manifest = IngestManifest.load(self.db_path)
+        input_files = SimpleDirectoryReader(self.path_to_documents, recursive=rec_flag, filename_as_id=True).input_files
+        if incremental:
+            files_to_load = self._prepare_incremental_update(manifest, input_files)
+        else:
+            # a fresh storage context: the new docstore replaces the persisted one on save
+            self._reset_vector_store()
+            self._init_vector_store()
+            self.index = VectorStoreIndex(nodes=[], storage_context=self.storage_context, insert_batch_size=self.insert_batch_size)
+            manifest.clear()
+            self.keyword_index.clear()
+            files_to_load = [str(path) for path in input_files]
+        manifest.data_path = self.path_to_documents
+
+        if window_nodes:
+            self._stream_into_index(manifest, files_to_load, num_workers, file_timeout, window_nodes)
+        else:
+            for loaded_files, documents in self._load_documents(files_to_load, num_workers, file_timeout):
+                self._insert_documents(documents)
+                self._record_documents(manifest, loaded_files, documents)
+        self._save_index(manifest)
+
+    def _stream_into_index(self, manifest: IngestManifest, files_to_load, num_workers: int, file_timeout: float, window_nodes: int):
+        # load -> chunk -> embed -> upsert in bounded windows, checkpointing the manifest
+        # on a CheckpointSchedule so an interrupted run resumes with --incremental; the
+        # last windows are saved by index_data
+        progress = self.last_ingest_progress = IngestProgress(len(files_to_load))
+        schedule = CheckpointSchedule(window_nodes)
+        window = IngestWindow(window_nodes)
+        batches = self._load_documents(files_to_load, num_workers, file_timeout, one_file_at_a_time=True)
+        for loaded_files, documents in prefetch(batches):
+            # a crashed run may have left part of these files in the vector store
+            self._remove_documents([document.doc_id for document in documents])
+            window.add(loaded_files, documents, run_transformations(documents, Settings.transformations))
+            if window.is_full():
+                self._commit_window(manifest, window, schedule)
+                progress.committed(window)
+                window = IngestWindow(window_nodes)
+        if not window.is_empty():
+            self._commit_window(manifest, window, schedule)
+            progress.committed(window)
+
+    def _commit_window(self, manifest: IngestManifest, window: IngestWindow, schedule: CheckpointSchedule):
+        # the manifest on disk only changes with a full save, so it never lists files
+        # whose nodes are not persisted yet
+        self._insert_nodes(window.nodes, window.documents)
+        self._record_documents(manifest, window.files, window.documents)
+        schedule.add(len(window.nodes))
+        if schedule.is_due():
+            self._save_index(manifest)
+            schedule.done()
+
+    def upsert_file(self, path: str):
+        path = os.path.abspath(path)
+        manifest = IngestManifest.load(self.db_path)
+        self._load_index_for_update()
+        documents = tag_documents(SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data(), self.path_to_documents)
+        self._remove_documents(set(manifest.doc_ids_for(path)) | {document.doc_id for document in documents})
+        self._insert_documents(documents)
+        manifest.forget(path)
+        self._record_documents(manifest, [path], documents)
+        self._save_index(manifest)
+        return [document.doc_id for document in documents]
+
+    def remove_file(self, path: str):
+        path = os.path.abspath(path)
+        manifest = IngestManifest.load(self.db_path)
+        if path not in manifest.files:
+            raise ValueError(f"{path} is not in the ingest manifest")
+        self._load_index_for_update()
+        self._remove_documents(manifest.doc_ids_for(path))
+        manifest.forget(path)
+        self._save_index(manifest)
+
+    def remove_document(self, doc_id: str):
+        manifest = IngestManifest.load(self.db_path)
+        self._load_index_for_update()
+        self._remove_documents([doc_id])
+        manifest.forget_doc_id(doc_id)
+        self._save_index(manifest)
+
+    def _save_index(self, manifest: IngestManifest):
         self.index.storage_context.persist(persist_dir=self.db_path)
-             
+        self.keyword_index.save()
+        manifest.save()
+
+    def _prepare_incremental_update(self, manifest: IngestManifest, input_files):
+        if not manifest.files:
+            logging.warning("No ingest manifest found, every file will be embedded. Run a full ingest on an empty index store first to avoid duplicated vectors.")
+        changes = manifest.diff(input_files)
+        logging.info(f"Incremental ingest: {changes}")
+
+        self._load_index_for_update()
+        for path in changes.changed + changes.deleted:
+            self._remove_documents(manifest.doc_ids_for(path))
+            manifest.forget(path)
+        # every file left in the manifest is now current, the outdated ones were forgotten above
+        manifest.version = MANIFEST_VERSION
+        return changes.new + changes.changed
+
+    def _load_documents(self, files_to_load, num_workers: int, file_timeout: float, one_file_at_a_time: bool = False):
+        # every document is tagged with its source area (folder under the data path) for routing
+        for loaded_files, documents in self._read_documents(files_to_load, num_workers, file_timeout, one_file_at_a_time):
+            yield loaded_files, tag_documents(documents, self.path_to_documents)
+
+    def _read_documents(self, files_to_load, num_workers: int, file_timeout: float, one_file_at_a_time: bool = False):
+        if not files_to_load:
+            return
+        if not num_workers and one_file_at_a_time:
+            for path in files_to_load:
+                yield [path], SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+            return
+        if not num_workers:
+            yield files_to_load, SimpleDirectoryReader(input_files=files_to_load, filename_as_id=True).load_data()
+            return
+
+        # files that fail are left out of the manifest so the next incremental run retries them
+        loader = ParallelDocumentLoader(num_workers=num_workers, file_timeout=file_timeout)
+        for loaded in loader.iter_documents(files_to_load):
+            if loaded.ok:
+                logging.info(f"Parsed {loaded.path} in {loaded.seconds:.1f}s")
+                yield [loaded.path], loaded.documents
+            else:
+                logging.error(f"Could not load {loaded.path}: {loaded.error}")
+
+    def _load_index_for_update(self):
+        # the docstore and index struct have to be the persisted ones, otherwise
+        # deletions would not reach the documents ingested by previous runs
+        if os.path.exists(os.path.join(self.db_path, "docstore.json")):
+            self.storage_context = StorageContext.from_defaults(vector_store=self.storage_context.vector_store, persist_dir=self.db_path)
+            self.index = load_index_from_storage(self.storage_context, insert_batch_size=self.insert_batch_size)
+        else:
+            self.index = VectorStoreIndex(nodes=[], storage_context=self.storage_context, insert_batch_size=self.insert_batch_size)
+
+    def _insert_documents(self, documents):
+        self._insert_nodes(run_transformations(documents, Settings.transformations), documents)
+
+    def _insert_nodes(self, nodes, documents):
+        self.index.insert_nodes(nodes)
+        self.keyword_index.add_nodes(nodes)
+        for document in documents:
+            self.index.docstore.set_document_hash(document.get_doc_id(), document.hash)
+
+    def _remove_documents(self, doc_ids):
+        for doc_id in doc_ids:
+            self.index.delete_ref_doc(doc_id, delete_from_docstore=True)
+            self.index.docstore.delete_document(doc_id, raise_error=False)
+            self.keyword_index.remove_ref_doc(doc_id)
+
+    @staticmethod
+    def _record_documents(manifest: IngestManifest, loaded_files, documents):
+        doc_ids_by_file = {str(path): [] for path in loaded_files}
+        for document in documents:
+            path = document.metadata.get("file_path")
+            if path in doc_ids_by_file:
+                doc_ids_by_file[path].append(document.doc_id)
+        for path, doc_ids in doc_ids_by_file.items():
+            manifest.record(path, doc_ids)
+
  
     def _load_vector_store(self):
-        self.db_client = chromadb.PersistentClient(path=self.db_path)
-        self.chroma_collection = self.db_client.get_or_create_collection("quickstart")
-        vector_store = ChromaVectorStore(chroma_collection=self.chroma_collection)
+        vector_store = self._create_vector_store()
         self.storage_context = StorageContext.from_defaults(vector_store=vector_store)
         self.index = VectorStoreIndex.from_vector_store(vector_store, storage=self.storage_context)            
 
-    def _retrieve_embeddings_for_prompt(self, prompt: str):
-        retriever = self.index.as_retriever()
-        fragments = retriever.retrieve(prompt)
+    def _get_retriever(self, areas=None):
+        if self.reranker is None:
+            return self._get_base_retriever(self.similarity_top_k, areas)
+        # the reranker gets a wider candidate set and keeps its own top_n
+        return RerankingRetriever(self._get_base_retriever(max(self.reranker.candidate_k, self.similarity_top_k), areas), self.reranker)
+
+    def _get_base_retriever(self, top_k: int, areas=None):
+        # areas restrict both the vector search (metadata prefilter) and the keyword search
+        node_filter = (lambda metadata: metadata.get(SOURCE_AREA_KEY) in areas) if areas else None
+        if self.retrieval_mode == RetrievalMode.KEYWORD:
+            return HybridRetriever(None, self.keyword_index, similarity_top_k=top_k, node_filter=node_filter)
+        vector_retriever = self.index.as_retriever(similarity_top_k=top_k * (2 if self.retrieval_mode == RetrievalMode.HYBRID else 1),
+                                                   filters=area_filters(areas) if areas else None)
+        if self.retrieval_mode == RetrievalMode.HYBRID:
+            return HybridRetriever(vector_retriever, self.keyword_index, keyword_weight=self.keyword_weight, similarity_top_k=top_k, node_filter=node_filter)
+        return vector_retriever
+
+    def _retrieve_embeddings_for_prompt(self, prompt: str, query_embedding=None):
+        query_bundle = QueryBundle(prompt, embedding=query_embedding)
+        areas = self.router.route(prompt) if self.router is not None else None
+        if areas:
+            fragments = self._get_retriever(areas).retrieve(query_bundle)
+            if fragments:
+                return fragments
+            # e.g. an index ingested before the nodes were tagged with their area
+            logging.info(f"No fragments in the areas {areas}, searching all of them")
+        retriever = self._get_retriever()
+        fragments = retriever.retrieve(query_bundle)
         return fragments
-    
-    def retrieve_answer(self, prompt: str):
-        fragments = self._retrieve_embeddings_for_prompt(prompt)
-        context = "\n------\n".join([ fragment.text for fragment in fragments ])
+
+    def _snapshot_path(self):
+        from index_snapshot import SNAPSHOT_FILE
+        return os.getenv("RAG_SNAPSHOT_PATH", os.path.join(self.db_path, SNAPSHOT_FILE))
+
+    def _index_version(self):
+        # every ingest or maintenance run rewrites these files, also from other processes,
+        # so their modification times identify the index the cached answers came from
+        if self.vector_backend == VectorBackend.SNAPSHOT:
+            store_file = self._snapshot_path()
+        elif self.vector_backend == VectorBackend.NUMPY:
+            store_file = os.path.join(self.db_path, "numpy_store", "nodes.json")
+        else:
+            store_file = os.path.join(self.db_path, "chroma.sqlite3")
+        version = []
+        for path in (os.path.join(self.db_path, MANIFEST_FILE), os.path.join(self.db_path, KEYWORD_INDEX_FILE), store_file):
+            try:
+                version.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                version.append(None)
+        return tuple(version)
+
+    def _lookup_cached_answer(self, prompt: str, trace=NOOP_TRACE):
+        # returns (answer, query_embedding, index_version), answer is None on a miss
+        if self.answer_cache is None:
+            return None, None, None
+        version = self._index_version()
+        embed_query = None
+        # keyword only retrieval never embeds the query, so it only gets exact hits
+        if self.retrieval_mode != RetrievalMode.KEYWORD:
+            def embed_query(query):
+                with trace.span("query_embedding"):
+                    return Settings.embed_model.get_query_embedding(query)
+        with trace.span("answer_cache"):
+            answer, query_embedding = self.answer_cache.lookup(prompt, version, embed_query)
+        self._trace_cache(trace, answer, query_embedding)
+        return answer, query_embedding, version
+
+    async def _alookup_cached_answer(self, prompt: str, trace=NOOP_TRACE):
+        # async version of _lookup_cached_answer, the query is embedded through the async client
+        if self.answer_cache is None:
+            return None, None, None
+        version = self._index_version()
+        embed_query = None
+        if self.retrieval_mode != RetrievalMode.KEYWORD:
+            async def embed_query(query):
+                with trace.span("query_embedding"):
+                    return await Settings.embed_model.aget_query_embedding(query)
+        with trace.span("answer_cache"):
+            answer, query_embedding = await self.answer_cache.alookup(prompt, version, embed_query)
+        self._trace_cache(trace, answer, query_embedding)
+        return answer, query_embedding, version
+
+    def _trace_cache(self, trace, answer, query_embedding):
+        # exact hits return before the query is embedded
+        if answer is None:
+            trace.set(cache="miss")
+        else:
+            trace.set(cache="semantic" if query_embedding is not None else "exact")
+            logging.info(f"Answer cache hit: {self.answer_cache.stats()}")
+
+    def _store_answer(self, prompt: str, query_embedding, answer: str, version):
+        if self.answer_cache is not None:
+            self.answer_cache.store(prompt, query_embedding, answer, version)
+
+    def _build_messages(self, prompt: str, fragments, trace=NOOP_TRACE):
+        with trace.span("context_packing"):
+            packed = pack_context(fragments, token_budget=self.context_token_budget)
+        logging.info(packed.report())
+        context = packed.text
 
         messages = [
             ChatMessage(role="system", content="Tú eres Tab el amable asistente de los docentes de la cátedra de ingeniería de software, la cual es parte de la facultad de ingeniería. Conoces los procedimientos y reglamentos de la facultad y de la cátedra, manejas información sobre materias, sobre la utilización de documentos del tipo, plantillas o templates y todo lo que los docentes necesitan para hacer su trabajo.  Trata de responder las preguntas con la mayor precisión posible. Si no sabes la respuesta, contesta que no tienes información para responder. Utiliza como contexto para elaborar la respuesta los siguientes datos: " + context),
             ChatMessage(role="user", content=prompt)
     
         ]
+        if trace.enabled:
+            trace.set(fragments=len(fragments), fragment_scores=[fragment.score for fragment in fragments],
+                      fragments_packed=len(packed.fragments), context_tokens=packed.used_tokens, context_saved_tokens=packed.tokens_saved,
+                      prompt_tokens=sum(count_tokens(message.content) for message in messages))
+        return messages
+
+    def _prepare_messages(self, prompt: str, trace):
+        # returns (cached_answer, messages, query_embedding, index_version)
+        answer, query_embedding, version = self._lookup_cached_answer(prompt, trace)
+        if answer is not None:
+            return answer, None, query_embedding, version
+        if query_embedding is None and self.retrieval_mode != RetrievalMode.KEYWORD:
+            with trace.span("query_embedding"):
+                query_embedding = Settings.embed_model.get_query_embedding(prompt)
+        with trace.span("retrieval"):
+            fragments = self._retrieve_embeddings_for_prompt(prompt, query_embedding)
+        return None, self._build_messages(prompt, fragments, trace), query_embedding, version
+
+    async def _aprepare_messages(self, prompt: str, trace):
+        # async version of _prepare_messages: the query embedding goes through the model's
+        # async client, which keeps its http connections pooled, and the vector/keyword
+        # search runs in a worker thread off the event loop
+        answer, query_embedding, version = await self._alookup_cached_answer(prompt, trace)
+        if answer is not None:
+            return answer, None, query_embedding, version
+        if query_embedding is None and self.retrieval_mode != RetrievalMode.KEYWORD:
+            with trace.span("query_embedding"):
+                query_embedding = await Settings.embed_model.aget_query_embedding(prompt)
+        with trace.span("retrieval"):
+            fragments = await asyncio.to_thread(self._retrieve_embeddings_for_prompt, prompt, query_embedding)
+        return None, self._build_messages(prompt, fragments, trace), query_embedding, version
+
+    def _trace_answer(self, trace, answer: str):
+        if trace.enabled:
+            trace.set(completion_tokens=count_tokens(answer))
+
+    def _finish_stream(self, prompt: str, stream: StreamedAnswer, query_embedding, version) -> dict:
+        timings = stream.timings()
+        logging.info(f"Streamed answer: {timings}")
+        self._store_answer(prompt, query_embedding, stream.answer, version)
+        self._trace_answer(stream.trace, stream.answer)
+        return timings
+
+    def retrieve_answer(self, prompt: str):
+        with self.instrumentation.trace(prompt) as trace:
+            answer, messages, query_embedding, version = self._prepare_messages(prompt, trace)
+            if answer is not None:
+                return answer
+
+            with trace.span("llm"):
+                response = Settings.llm.chat(messages)
+            logging.debug(response)
+            answer = response.message.content or ""
+            self._store_answer(prompt, query_embedding, answer, version)
+            self._trace_answer(trace, answer)
+            return answer
+
+    def retrieve_answer_stream(self, prompt: str):
+        # yields the answer in pieces as the model produces them; the timings of the
+        # last call (retrieval, first token, total) are left in self.last_timings
+        started = time.perf_counter()
+        with self.instrumentation.trace(prompt) as trace:
+            answer, messages, query_embedding, version = self._prepare_messages(prompt, trace)
+            stream = StreamedAnswer(started, trace)
+            if answer is not None:
+                self.last_timings = {**stream.timings(cached=True), "cached": True}
+                yield answer
+                return
 
-        self.query_model.llm
-        response = Settings.llm.chat(messages)
-        print("**\n\n")
-        print(response)
-        return response.__str__()
+            with trace.span("llm"):
+                for chunk in Settings.llm.stream_chat(messages):
+                    if chunk.delta:
+                        yield stream.add(chunk.delta)
+            self.last_timings = {**self._finish_stream(prompt, stream, query_embedding, version), "cached": False}
 
+    async def aretrieve_answer_stream(self, prompt: str):
+        # async version of retrieve_answer_stream; the timings are only logged, concurrent
+        # requests would overwrite each other in last_timings
+        started = time.perf_counter()
+        with self.instrumentation.trace(prompt) as trace:
+            answer, messages, query_embedding, version = await self._aprepare_messages(prompt, trace)
+            stream = StreamedAnswer(started, trace)
+            if answer is not None:
+                yield answer
+                return
 
+            with trace.span("llm"):
+                async for chunk in await Settings.llm.astream_chat(messages):
+                    if chunk.delta:
+                        yield stream.add(chunk.delta)
+            self._finish_stream(prompt, stream, query_embedding, version)
 
+    async def aretrieve_answer(self, prompt: str):
+        return "".join([token async for token in self.aretrieve_answer_stream(prompt)])
@@ -0,0 +1,159 @@
+from array import array
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+
+_WHITESPACE = re.compile(r"\s+")
+_SQLITE_MAX_PARAMS = 500
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+class EmbeddingCache:
+    # Content addressed store of embeddings in a local SQLite file. It can be opened
+    # by the ingest and the chatbot processes at the same time (WAL journal).
+    def __init__(self, path: str, max_entries: int = 20000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, dimensions, text: str) -> str:
+        payload = f"{model}\0{dimensions or ''}\0{normalize_text(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys) -> dict:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQLITE_MAX_PARAMS):
+                chunk = keys[start:start + _SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, vectors_by_key: dict):
+        if not vectors_by_key:
+            return
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in vectors_by_key.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_entries:
+            self._conn.execute("DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (count - self.max_entries,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbedding(BaseEmbedding):
+    # Wraps another llama_index embedding model and only forwards the texts whose
+    # embedding is not in the cache yet.
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    _dimensions: int = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache: EmbeddingCache, dimensions: int = None, **kwargs):
+        super().__init__(model_name=embed_model.model_name, embed_batch_size=embed_model.embed_batch_size,
+                         callback_manager=embed_model.callback_manager, **kwargs)
+        self._embed_model = embed_model
+        self._cache = cache
+        self._dimensions = dimensions
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _lookup(self, texts):
+        keys = [self._cache.make_key(self.model_name, self._dimensions, text) for text in texts]
+        found = self._cache.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        return keys, found, missing
+
+    def _store(self, keys, found, missing, vectors):
+        computed = dict(zip(missing.keys(), vectors))
+        self._cache.put_many(computed)
+        found.update(computed)
+        return [found[key] for key in keys]
+
+    def _get_query_embedding(self, query: str):
+        keys, found, missing = self._lookup([query])
+        vectors = [self._embed_model._get_query_embedding(query)] if missing else []
+        return self._store(keys, found, missing, vectors)[0]
+
+    # the async versions run the sqlite reads and writes in a worker thread: the cache
+    # can wait up to 30s on a lock held by an ingest, which must not stall the event loop
+    async def _aget_query_embedding(self, query: str):
+        keys, found, missing = await asyncio.to_thread(self._lookup, [query])
+        vectors = [await self._embed_model._aget_query_embedding(query)] if missing else []
+        return (await asyncio.to_thread(self._store, keys, found, missing, vectors))[0]
+
+    def _get_text_embedding(self, text: str):
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str):
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts):
+        keys, found, missing = self._lookup(texts)
+        vectors = self._embed_model._get_text_embeddings(list(missing.values())) if missing else []
+        return self._store(keys, found, missing, vectors)
+
+    async def _aget_text_embeddings(self, texts):
+        keys, found, missing = await asyncio.to_thread(self._lookup, texts)
+        vectors = await self._embed_model._aget_text_embeddings(list(missing.values())) if missing else []
+        return await asyncio.to_thread(self._store, keys, found, missing, vectors)
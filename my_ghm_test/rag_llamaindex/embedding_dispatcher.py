@@ -0,0 +1,162 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+import time
+
+import openai
+from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from token_counting import count_tokens
+
+
+class RetryableEmbeddingError(Exception):
+    def __init__(self, message: str, retry_after: float = None, rate_limited: bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.rate_limited = rate_limited
+
+
+def _retry_after_seconds(headers) -> float:
+    if headers is None:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class EmbeddingDispatcher:
+    # Splits texts into batches bounded by token count and keeps several of them in
+    # flight. Every 429 halves the concurrency and the batch budget and pauses new
+    # requests for Retry-After; a full round of successes grows both back.
+    def __init__(self, client, model: str, tokenizer, dimensions: int = None,
+                 max_batch_tokens: int = 60000, min_batch_tokens: int = 4000, max_batch_size: int = 2048,
+                 max_concurrency: int = 8, max_retries: int = 8):
+        self.client = client
+        self.model = model
+        self.tokenizer = tokenizer
+        self.dimensions = dimensions
+        self.max_batch_tokens = max_batch_tokens
+        self.min_batch_tokens = min_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+
+        self.concurrency = max_concurrency
+        self.batch_tokens = max_batch_tokens
+        self.requests = 0
+        self.rate_limited = 0
+        self.tokens = 0
+        self._paused_until = 0.0
+        self._success_streak = 0
+        self._failures = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed")
+
+    def embed(self, texts):
+        token_counts = [count_tokens(text, self.tokenizer) for text in texts]
+        results = [None] * len(texts)
+        pending = deque(range(len(texts)))
+        in_flight = {}
+
+        while pending or in_flight:
+            pause = self._paused_until - time.monotonic()
+            while pending and pause <= 0 and len(in_flight) < self.concurrency:
+                batch = self._next_batch(pending, token_counts)
+                future = self._executor.submit(self._request, [texts[i] for i in batch])
+                in_flight[future] = batch
+                self.requests += 1
+
+            if not in_flight:
+                time.sleep(max(pause, 0.0))
+                continue
+
+            done, _ = wait(in_flight, timeout=pause if pause > 0 else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                try:
+                    vectors = future.result()
+                except RetryableEmbeddingError as e:
+                    self._on_retryable_error(e)
+                    pending.extendleft(reversed(batch))
+                    continue
+                for i, vector in zip(batch, vectors):
+                    results[i] = vector
+                self.tokens += sum(token_counts[i] for i in batch)
+                self._on_success()
+        return results
+
+    def _next_batch(self, pending, token_counts):
+        batch = [pending.popleft()]
+        tokens = token_counts[batch[0]]
+        while pending and len(batch) < self.max_batch_size and tokens + token_counts[pending[0]] <= self.batch_tokens:
+            tokens += token_counts[pending[0]]
+            batch.append(pending.popleft())
+        return batch
+
+    def _request(self, batch):
+        kwargs = {"dimensions": self.dimensions} if self.dimensions else {}
+        try:
+            response = self.client.embeddings.create(input=batch, model=self.model, **kwargs)
+        except openai.RateLimitError as e:
+            raise RetryableEmbeddingError(str(e), _retry_after_seconds(e.response.headers), rate_limited=True)
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            raise RetryableEmbeddingError(str(e))
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def _on_retryable_error(self, error: RetryableEmbeddingError):
+        self._failures += 1
+        if self._failures > self.max_retries:
+            raise RuntimeError(f"Embedding requests keep failing after {self.max_retries} retries: {error}")
+        if error.rate_limited:
+            self.rate_limited += 1
+            self.concurrency = max(1, self.concurrency // 2)
+            self.batch_tokens = max(self.min_batch_tokens, self.batch_tokens // 2)
+        delay = error.retry_after if error.retry_after is not None else min(60.0, 2.0 ** self._failures)
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self._success_streak = 0
+        logging.warning(f"Embedding request failed ({error}), retrying in {delay:.1f}s with concurrency={self.concurrency} batch_tokens={self.batch_tokens}")
+
+    def _on_success(self):
+        self._failures = 0
+        self._success_streak += 1
+        if self._success_streak >= self.concurrency:
+            self._success_streak = 0
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            self.batch_tokens = min(self.max_batch_tokens, int(self.batch_tokens * 1.25))
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "tokens": self.tokens,
+            "concurrency": self.concurrency,
+            "batch_tokens": self.batch_tokens,
+        }
+
+
+class DispatchedOpenAIEmbedding(OpenAIEmbedding):
+    # Same model as OpenAIEmbedding, but document batches go through an
+    # EmbeddingDispatcher instead of being sent one after another.
+    _dispatcher: EmbeddingDispatcher = PrivateAttr()
+
+    def __init__(self, tokenizer, max_concurrency: int = 8, max_batch_tokens: int = 60000, **kwargs):
+        super().__init__(embed_batch_size=2048, **kwargs)
+        client = openai.OpenAI(api_key=self.api_key, base_url=self.api_base, max_retries=0, timeout=self.timeout)
+        self._dispatcher = EmbeddingDispatcher(client, self.model_name, tokenizer, dimensions=self.dimensions,
+                                               max_batch_tokens=max_batch_tokens, max_concurrency=max_concurrency)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "DispatchedOpenAIEmbedding"
+
+    @property
+    def dispatcher(self) -> EmbeddingDispatcher:
+        return self._dispatcher
+
+    def _get_text_embeddings(self, texts):
+        return self._dispatcher.embed([text.replace("\n", " ") for text in texts])
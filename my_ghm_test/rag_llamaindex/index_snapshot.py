@@ -0,0 +1,280 @@
+import argparse
+from collections import OrderedDict
+import json
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, VectorStoreQuery, VectorStoreQueryResult
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+from numpy_vector_store import FILTER_KEYS, column_codes, column_mask, passes_filters
+from vector_quantization import normalize, top_k
+
+
+SNAPSHOT_FILE = "index.snapshot"
+SNAPSHOT_MAGIC = b"RAGSNAP\0"
+SNAPSHOT_VERSION = 2
+_RECORD_CACHE_SIZE = 1024
+_SCORE_BLOCK_ROWS = 65536
+_ALIGNMENT = 64
+_PREFIX = struct.Struct("<8sII")  # magic, format version, header length
+
+# Layout, all offsets absolute and 64 byte aligned:
+#   prefix   magic, version and the length of the json header that follows it
+#   vectors  count x dimensions normalized float32 (or float16) rows, C order
+#   offsets  count + 1 little endian uint64 offsets into the records section
+#   columns  per filter key, count little endian uint32 codes into the header's value list
+#   records  one utf-8 json array [node_id, ref_doc_id, text, metadata] per row
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def write_snapshot(path: str, ids, embeddings, texts, metadatas, dtype: str = "float32", source: str = "", filter_keys=FILTER_KEYS):
+    vectors = normalize(np.asarray(embeddings, dtype=np.float32)).astype(dtype) if len(ids) else np.zeros((0, 0), dtype=dtype)
+    records = [json.dumps([node_id, metadata.get("ref_doc_id"), text, metadata], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+               for node_id, text, metadata in zip(ids, texts, metadatas)]
+    offsets = np.zeros(len(records) + 1, dtype="<u8")
+    offsets[1:] = np.cumsum([len(record) for record in records])
+    columns, codes_by_key = {}, {}
+    for key in filter_keys:
+        values, codes_by_key[key] = column_codes(metadatas, key)
+        columns[key] = {"values": values, "offset": 0}
+
+    header = {"count": len(ids), "dimensions": int(vectors.shape[1]) if len(ids) else 0, "dtype": dtype,
+              "created": time.time(), "source": source}
+    # the header holds its own section offsets, so they are computed with placeholders first
+    sections = {"vectors_offset": 0, "offsets_offset": 0, "records_offset": 0, "records_nbytes": int(offsets[-1])}
+    header_bytes = json.dumps({**header, **sections, "columns": columns}).encode("utf-8") + b" " * 32 * (4 + len(columns))
+    sections["vectors_offset"] = _aligned(_PREFIX.size + len(header_bytes))
+    sections["offsets_offset"] = _aligned(sections["vectors_offset"] + vectors.nbytes)
+    end = sections["offsets_offset"] + offsets.nbytes
+    for key in filter_keys:
+        columns[key]["offset"] = _aligned(end)
+        end = columns[key]["offset"] + codes_by_key[key].nbytes
+    sections["records_offset"] = _aligned(end)
+    header_bytes = json.dumps({**header, **sections, "columns": columns}).encode("utf-8").ljust(len(header_bytes))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        blocks = [(sections["vectors_offset"], vectors), (sections["offsets_offset"], offsets)]
+        blocks += [(columns[key]["offset"], codes_by_key[key]) for key in filter_keys]
+        for offset, data in blocks:
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(np.ascontiguousarray(data).tobytes())
+        f.write(b"\0" * (sections["records_offset"] - f.tell()))
+        for record in records:
+            f.write(record)
+    os.replace(tmp_path, path)
+    return header
+
+
+def read_header(path: str) -> dict:
+    with open(path, "rb") as f:
+        magic, version, header_length = _PREFIX.unpack(f.read(_PREFIX.size))
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not an index snapshot")
+        # format 1 has no filter columns, its filtered queries decode the records instead
+        if version not in (1, SNAPSHOT_VERSION):
+            raise ValueError(f"{path} has snapshot format {version}, this code reads formats 1 and {SNAPSHOT_VERSION}")
+        return json.loads(f.read(header_length))
+
+
+class SnapshotVectorStore(BasePydanticVectorStore):
+    # Read-only store over a snapshot file: the vectors, the record offsets and the
+    # records are memory-mapped, so opening it costs the same for any corpus size and
+    # records are only decoded when they are returned. Filters on FILTER_KEYS are
+    # evaluated on the code columns; other filters decode records through a small LRU.
+    stores_text: bool = True
+    flat_metadata: bool = False
+    snapshot_path: str
+
+    _header: dict = PrivateAttr(default=None)
+    _matrix: np.ndarray = PrivateAttr(default=None)
+    _offsets: np.ndarray = PrivateAttr(default=None)
+    _records: np.ndarray = PrivateAttr(default=None)
+    _columns: dict = PrivateAttr(default_factory=dict)
+    _decoded: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    # queries run in worker threads (asyncio.to_thread), the LRU is shared between them
+    _decoded_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, snapshot_path: str, **kwargs):
+        super().__init__(snapshot_path=snapshot_path, **kwargs)
+        self._header = read_header(snapshot_path)
+        count = self._header["count"]
+        if count:
+            self._matrix = np.memmap(snapshot_path, dtype=self._header["dtype"], mode="r", offset=self._header["vectors_offset"],
+                                     shape=(count, self._header["dimensions"]))
+            self._offsets = np.memmap(snapshot_path, dtype="<u8", mode="r", offset=self._header["offsets_offset"], shape=(count + 1,))
+            self._records = np.memmap(snapshot_path, dtype=np.uint8, mode="r", offset=self._header["records_offset"],
+                                      shape=(self._header["records_nbytes"],))
+            for key, column in self._header.get("columns", {}).items():
+                self._columns[key] = (column["values"], np.memmap(snapshot_path, dtype="<u4", mode="r", offset=column["offset"], shape=(count,)))
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SnapshotVectorStore"
+
+    @property
+    def client(self):
+        return None
+
+    @property
+    def header(self) -> dict:
+        return self._header
+
+    def __len__(self):
+        return self._header["count"]
+
+    def __bool__(self):
+        # StorageContext.from_defaults tests `if vector_store:`, an empty snapshot must
+        # not be swapped for a SimpleVectorStore
+        return True
+
+    def _record(self, row: int):
+        with self._decoded_lock:
+            record = self._decoded.get(row)
+            if record is not None:
+                self._decoded.move_to_end(row)
+                return record
+        record = json.loads(self._records[int(self._offsets[row]):int(self._offsets[row + 1])].tobytes())
+        with self._decoded_lock:
+            self._decoded[row] = record
+            if len(self._decoded) > _RECORD_CACHE_SIZE:
+                self._decoded.popitem(last=False)
+        return record
+
+    def _candidate_rows(self, query: VectorStoreQuery):
+        mask = column_mask(self._columns, query.filters) if query.filters else None
+        rows = np.flatnonzero(mask) if mask is not None else np.arange(len(self))
+        doc_ids = set(query.doc_ids or [])
+        node_ids = set(query.node_ids or [])
+        record_filters = query.filters if query.filters and mask is None else None
+        if not (doc_ids or node_ids or record_filters):
+            return rows.astype(np.int64)
+        return np.asarray([row for row in rows
+                           if (not doc_ids or self._record(row)[1] in doc_ids)
+                           and (not node_ids or self._record(row)[0] in node_ids)
+                           and (not record_filters or passes_filters(self._record(row)[3], record_filters))], dtype=np.int64)
+
+    def add(self, nodes, **add_kwargs):
+        raise ValueError("Snapshots are read-only, ingest into chroma or numpy and export a new snapshot")
+
+    def delete(self, ref_doc_id: str, **delete_kwargs):
+        raise ValueError("Snapshots are read-only, ingest into chroma or numpy and export a new snapshot")
+
+    def persist(self, persist_path: str = None, fs=None):
+        pass
+
+    def query(self, query: VectorStoreQuery, **kwargs) -> VectorStoreQueryResult:
+        if not len(self) or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        rows = None
+        if query.filters or query.doc_ids or query.node_ids:
+            rows = self._candidate_rows(query)
+            if not len(rows):
+                return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        query_vector = normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        scores = self._scores(query_vector, rows)
+        top = top_k(scores, query.similarity_top_k)
+        selected = top if rows is None else rows[top]
+        records = [self._record(row) for row in selected]
+        return VectorStoreQueryResult(nodes=[metadata_dict_to_node(record[3], text=record[2]) for record in records],
+                                      similarities=[float(score) for score in scores[top]], ids=[record[0] for record in records])
+
+    def _scores(self, query_vector: np.ndarray, rows=None) -> np.ndarray:
+        matrix = self._matrix if rows is None else self._matrix[rows]
+        if matrix.dtype == np.float32:
+            return matrix @ query_vector
+        # float16 has no BLAS matmul, so score it in float32 blocks instead of converting the whole matrix
+        return np.concatenate([matrix[start:start + _SCORE_BLOCK_ROWS].astype(np.float32) @ query_vector
+                               for start in range(0, len(matrix), _SCORE_BLOCK_ROWS)])
+
+    def iter_rows(self):
+        for row in range(len(self)):
+            node_id, _, text, metadata = self._record(row)
+            yield node_id, np.asarray(self._matrix[row], dtype=np.float32), text, metadata
+
+
+def _load_source(database_path: str, source: str):
+    # returns ids, embeddings, texts, metadatas from the chroma collection or the numpy store
+    if source == "numpy":
+        from numpy_vector_store import NumpyVectorStore, NODES_FILE
+
+        store = NumpyVectorStore(os.path.join(database_path, "numpy_store"))
+        if store.vectors is None:
+            raise ValueError("The numpy store has no full precision vectors to export")
+        with open(os.path.join(store.persist_dir, NODES_FILE), "r", encoding="utf-8") as f:
+            table = json.load(f)
+        return table["ids"], store.vectors, table["texts"], table["metadatas"]
+    import chromadb
+
+    records = chromadb.PersistentClient(path=database_path).get_or_create_collection("quickstart").get(include=["embeddings", "documents", "metadatas"])
+    return records["ids"], records["embeddings"], records["documents"], records["metadatas"]
+
+
+def export_snapshot(database_path: str, snapshot_path: str, source: str, dtype: str):
+    ids, embeddings, texts, metadatas = _load_source(database_path, source)
+    header = write_snapshot(snapshot_path, ids, embeddings, texts, metadatas, dtype=dtype, source=source)
+    print(f"Wrote {header['count']} vectors of {header['dimensions']} dims to {snapshot_path} ({os.path.getsize(snapshot_path) / 2**20:.1f} MB)")
+
+
+def import_snapshot(database_path: str, snapshot_path: str, target: str):
+    store = SnapshotVectorStore(snapshot_path)
+    ids, embeddings, texts, metadatas = [], [], [], []
+    for node_id, vector, text, metadata in store.iter_rows():
+        ids.append(node_id)
+        embeddings.append(vector)
+        texts.append(text)
+        metadatas.append(metadata)
+    if target == "numpy":
+        from numpy_vector_store import NumpyVectorStore
+
+        numpy_store = NumpyVectorStore(os.path.join(database_path, "numpy_store"), dtype=store.header["dtype"])
+        numpy_store.clear()
+        numpy_store.add_rows(ids, embeddings, texts, metadatas)
+        numpy_store.persist()
+    else:
+        import chromadb
+
+        client = chromadb.PersistentClient(path=database_path)
+        try:
+            client.delete_collection("quickstart")
+        except ValueError:
+            pass
+        collection = client.get_or_create_collection("quickstart")
+        batch_size = client.get_max_batch_size()
+        for start in range(0, len(ids), batch_size):
+            collection.add(ids=ids[start:start + batch_size], embeddings=[vector.tolist() for vector in embeddings[start:start + batch_size]],
+                           documents=texts[start:start + batch_size], metadatas=metadatas[start:start + batch_size])
+    print(f"Imported {len(ids)} vectors from {snapshot_path} into the {target} store of {database_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the index into one snapshot file or import a snapshot into a vector store")
+    parser.add_argument("command", choices=["export", "import", "info"])
+    parser.add_argument("--database-path", default=os.path.join(os.path.dirname(__file__), "./index_store"))
+    parser.add_argument("--snapshot", help=f"snapshot file, default <database-path>/{SNAPSHOT_FILE}")
+    parser.add_argument("--store", choices=["chroma", "numpy"], default="chroma", help="store exported from or imported into")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    args = parser.parse_args()
+
+    snapshot_path = args.snapshot or os.path.join(args.database_path, SNAPSHOT_FILE)
+    if args.command == "export":
+        export_snapshot(args.database_path, snapshot_path, args.store, args.dtype)
+    elif args.command == "import":
+        import_snapshot(args.database_path, snapshot_path, args.store)
+    else:
+        print(json.dumps(read_header(snapshot_path), indent=2))
+
+
+if __name__ == "__main__":
+    main()
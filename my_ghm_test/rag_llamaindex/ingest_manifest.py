@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+
+
+MANIFEST_FILE = "ingest_manifest.json"
+# 2: nodes carry the source_area metadata used for routing, files ingested under
+# version 1 don't have it and are re-ingested by the next incremental run
+MANIFEST_VERSION = 2
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ManifestDiff:
+    def __init__(self):
+        self.new = []
+        self.changed = []
+        self.deleted = []
+        self.unchanged = []
+
+    def has_changes(self) -> bool:
+        return bool(self.new or self.changed or self.deleted)
+
+    def __str__(self):
+        return (f"new={len(self.new)} changed={len(self.changed)} "
+                f"deleted={len(self.deleted)} unchanged={len(self.unchanged)}")
+
+
+class IngestManifest:
+    # Keeps, per ingested file, the stat data and content hash seen at ingest time
+    # together with the ids of the documents it produced, so a later run can tell
+    # which files need to be re-embedded and which vectors belong to a removed file.
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self.files = {}
+        self.version = MANIFEST_VERSION
+        # documents folder of the last ingest, source areas are relative to it
+        self.data_path = None
+
+    @classmethod
+    def load(cls, database_path: str):
+        manifest = cls(os.path.join(database_path, MANIFEST_FILE))
+        if os.path.exists(manifest.manifest_path):
+            with open(manifest.manifest_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            manifest.files = stored.get("files", {})
+            manifest.version = stored.get("version", 1)
+            manifest.data_path = stored.get("data_path")
+        return manifest
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "data_path": self.data_path, "files": self.files}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def clear(self):
+        self.files = {}
+        self.version = MANIFEST_VERSION
+
+    @property
+    def outdated(self) -> bool:
+        return self.version < MANIFEST_VERSION
+
+    def diff(self, input_files) -> ManifestDiff:
+        result = ManifestDiff()
+        seen = set()
+        for path in input_files:
+            path = str(path)
+            seen.add(path)
+            entry = self.files.get(path)
+            if entry is None:
+                result.new.append(path)
+                continue
+
+            # ingested by an older version, its stored nodes lack metadata this one adds
+            if self.outdated:
+                result.changed.append(path)
+                continue
+
+            stat = os.stat(path)
+            if entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                result.unchanged.append(path)
+                continue
+
+            # mtime moves on copies and checkouts, only the content hash decides
+            if entry["hash"] == file_content_hash(path):
+                entry["mtime"] = stat.st_mtime
+                entry["size"] = stat.st_size
+                result.unchanged.append(path)
+            else:
+                result.changed.append(path)
+
+        result.deleted = [path for path in self.files if path not in seen]
+        return result
+
+    def doc_ids_for(self, path: str):
+        entry = self.files.get(str(path))
+        return list(entry["doc_ids"]) if entry else []
+
+    def record(self, path: str, doc_ids):
+        path = str(path)
+        stat = os.stat(path)
+        self.files[path] = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "hash": file_content_hash(path),
+            "doc_ids": list(doc_ids),
+        }
+
+    def forget(self, path: str):
+        self.files.pop(str(path), None)
+
+    def forget_doc_id(self, doc_id: str):
+        for path, entry in list(self.files.items()):
+            if doc_id in entry["doc_ids"]:
+                entry["doc_ids"].remove(doc_id)
+                if not entry["doc_ids"]:
+                    del self.files[path]
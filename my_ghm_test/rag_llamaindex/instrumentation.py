@@ -0,0 +1,187 @@
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from request_gate import RequestTimeoutError
+
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_NULL_SPAN = nullcontext()
+# a request cancelled by the gate's deadline (or abandoned by its client mid stream)
+# sees one of these at the point it was suspended
+_TIMEOUT_ERRORS = (asyncio.CancelledError, asyncio.TimeoutError, GeneratorExit, RequestTimeoutError)
+
+
+def outcome_of(error) -> str:
+    if error is None:
+        return "ok"
+    return "timeout" if isinstance(error, _TIMEOUT_ERRORS) else "error"
+
+
+class NoopTrace:
+    # handed out when instrumentation is disabled, every call is a constant-time no-op
+    enabled = False
+
+    def span(self, name: str):
+        return _NULL_SPAN
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, **counts):
+        pass
+
+    def finish(self, outcome: str = "ok"):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        return False
+
+
+NOOP_TRACE = NoopTrace()
+
+
+class QueryTrace:
+    enabled = True
+
+    def __init__(self, instrumentation, question: str):
+        self.instrumentation = instrumentation
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.attributes = {"question": question}
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name] = self.spans.get(name, 0.0) + time.perf_counter() - started
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, **counts):
+        for name, value in counts.items():
+            self.attributes[name] = self.attributes.get(name, 0) + value
+
+    def finish(self, outcome: str = "ok"):
+        self.spans["total"] = time.perf_counter() - self.started
+        self.attributes["outcome"] = outcome
+        self.instrumentation.record(self)
+
+    # used as a context manager the trace is finished however the block ends, with
+    # the outcome (ok, timeout or error) taken from the exception that ended it
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self.finish(outcome_of(error))
+        return False
+
+
+class Instrumentation:
+    # Per query spans (seconds per stage), token counts, fragment scores and cache hits.
+    # Finished traces go to the "rag.trace" logger as one json line each and into
+    # Prometheus style counters and histograms served on /metrics by start_metrics_server.
+    def __init__(self, enabled: bool = False, log_path: str = None):
+        self.enabled = enabled
+        self.logger = logging.getLogger("rag.trace")
+        if enabled:
+            handler = logging.FileHandler(log_path, encoding="utf-8") if log_path else logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def trace(self, question: str = ""):
+        return QueryTrace(self, question) if self.enabled else NOOP_TRACE
+
+    def _count(self, name: str, labels: tuple, value: float = 1):
+        self._counters[(name, labels)] = self._counters.get((name, labels), 0) + value
+
+    def _observe(self, name: str, labels: tuple, value: float):
+        histogram = self._histograms.setdefault((name, labels), [[0] * len(STAGE_BUCKETS), 0, 0.0])
+        for i, bound in enumerate(STAGE_BUCKETS):
+            if value <= bound:
+                histogram[0][i] += 1
+        histogram[1] += 1
+        histogram[2] += value
+
+    def record(self, trace: QueryTrace):
+        attributes = trace.attributes
+        with self._lock:
+            self._count("rag_queries_total", (("cache", attributes.get("cache", "off")), ("outcome", attributes.get("outcome", "ok"))))
+            for stage, seconds in trace.spans.items():
+                self._observe("rag_stage_seconds", (("stage", stage),), seconds)
+            for kind in ("prompt", "completion", "context", "context_saved"):
+                if f"{kind}_tokens" in attributes:
+                    self._count("rag_tokens_total", (("kind", kind),), attributes[f"{kind}_tokens"])
+            self._count("rag_fragments_total", (), attributes.get("fragments", 0))
+        self.logger.info(json.dumps({"timestamp": time.time(), "spans": trace.spans, **attributes}, ensure_ascii=False, default=str))
+
+    def render_metrics(self) -> str:
+        def label_text(labels, extra=()):
+            pairs = [f'{key}="{value}"' for key, value in (*labels, *extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{name}{label_text(labels)} {value}" for (metric, labels), value in self._counters.items() if metric == name)
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), (buckets, count, total) in self._histograms.items():
+                    if metric != name:
+                        continue
+                    for bound, bucket_count in zip(STAGE_BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{label_text(labels, (('le', bound),))} {bucket_count}")
+                    lines.append(f"{name}_bucket{label_text(labels, (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{label_text(labels)} {total}")
+                    lines.append(f"{name}_count{label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def start_metrics_server(self, port: int, host: str = "0.0.0.0"):
+        instrumentation = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = instrumentation.render_metrics().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, name="rag-metrics", daemon=True).start()
+        return self._server
+
+
+def instrumentation_from_env():
+    # RAG_INSTRUMENTATION=1 enables tracing, RAG_TRACE_LOG sends the json lines to a file
+    # and RAG_METRICS_PORT serves /metrics on that port
+    enabled = os.getenv("RAG_INSTRUMENTATION", "0") != "0" or bool(os.getenv("RAG_METRICS_PORT"))
+    instrumentation = Instrumentation(enabled=enabled, log_path=os.getenv("RAG_TRACE_LOG"))
+    if enabled and os.getenv("RAG_METRICS_PORT"):
+        instrumentation.start_metrics_server(int(os.environ["RAG_METRICS_PORT"]))
+    return instrumentation
@@ -0,0 +1,196 @@
+import argparse
+import json
+import math
+import os
+import re
+import unicodedata
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeRelationship, NodeWithScore, RelatedNodeInfo, TextNode
+
+
+KEYWORD_INDEX_FILE = "keyword_index.json"
+_TOKEN = re.compile(r"[a-z0-9]+")
+SPANISH_STOPWORDS = set("""
+a al algo algun alguna algunas alguno algunos ante antes como con contra cual cuales cuando de del desde donde dos
+el ella ellas ellos en entre era es esa esas ese eso esos esta estas este esto estos fue ha hay la las le les lo los
+mas me mi muy ni no nos o otra otro para pero por que quien se segun ser si sin sobre son su sus tambien te tiene
+todo todos tu un una uno unos y ya yo cada puede pueden debe deben hacer como cual
+""".split())
+
+
+def fold_accents(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def tokenize(text: str):
+    # accent folded, lower case words and codes ("DA1", "NSP"), Spanish stop words
+    # dropped and plurals reduced so "evaluaciones" also finds "evaluacion"
+    tokens = []
+    for token in _TOKEN.findall(fold_accents(text).lower()):
+        if token in SPANISH_STOPWORDS or (len(token) == 1 and not token.isdigit()):
+            continue
+        if len(token) > 4 and token.endswith("es") and token[-3] in "lnrdjz":
+            token = token[:-2]
+        elif len(token) > 3 and token.endswith("s"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class KeywordIndex:
+    # BM25 inverted index over the same nodes as the vector store, persisted as json
+    # next to the other index files and kept in sync by the ingest and maintenance code.
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.docs = {}
+        self.postings = {}
+        self.total_length = 0
+        self.nodes_by_ref_doc = {}
+
+    @classmethod
+    def load(cls, database_path: str):
+        index = cls(os.path.join(database_path, KEYWORD_INDEX_FILE))
+        if os.path.exists(index.path):
+            with open(index.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            index.docs = data["docs"]
+            index.postings = data["postings"]
+            index.total_length = sum(doc["length"] for doc in index.docs.values())
+            for node_id, doc in index.docs.items():
+                index.nodes_by_ref_doc.setdefault(doc["ref_doc_id"], set()).add(node_id)
+        return index
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"docs": self.docs, "postings": self.postings}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.docs = {}
+        self.postings = {}
+        self.total_length = 0
+        self.nodes_by_ref_doc = {}
+
+    def __len__(self):
+        return len(self.docs)
+
+    @staticmethod
+    def _indexed_text(text: str, metadata: dict) -> str:
+        return f"{metadata.get('file_name', '')}\n{text}"
+
+    def add_nodes(self, nodes):
+        for node in nodes:
+            self.add(node.node_id, node.ref_doc_id, node.get_content(metadata_mode=MetadataMode.NONE), dict(node.metadata))
+
+    def add(self, node_id: str, ref_doc_id: str, text: str, metadata: dict):
+        if node_id in self.docs:
+            self.remove_node(node_id)
+        tokens = tokenize(self._indexed_text(text, metadata))
+        frequencies = {}
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+        for token, frequency in frequencies.items():
+            self.postings.setdefault(token, {})[node_id] = frequency
+        self.docs[node_id] = {"ref_doc_id": ref_doc_id, "length": len(tokens), "text": text, "metadata": metadata}
+        self.nodes_by_ref_doc.setdefault(ref_doc_id, set()).add(node_id)
+        self.total_length += len(tokens)
+
+    def remove_node(self, node_id: str):
+        doc = self.docs.pop(node_id, None)
+        if doc is None:
+            return
+        self.total_length -= doc["length"]
+        self.nodes_by_ref_doc.get(doc["ref_doc_id"], set()).discard(node_id)
+        for token in set(tokenize(self._indexed_text(doc["text"], doc["metadata"]))):
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(node_id, None)
+                if not postings:
+                    del self.postings[token]
+
+    def remove_ref_doc(self, ref_doc_id: str):
+        for node_id in list(self.nodes_by_ref_doc.pop(ref_doc_id, ())):
+            self.remove_node(node_id)
+
+    def search(self, query: str, top_k: int = 2, node_filter=None):
+        if not self.docs:
+            return []
+        average_length = self.total_length / len(self.docs)
+        scores = {}
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.docs) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for node_id, frequency in postings.items():
+                length_norm = 1 - self.b + self.b * self.docs[node_id]["length"] / average_length
+                scores[node_id] = scores.get(node_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+        if node_filter is not None:
+            scores = {node_id: score for node_id, score in scores.items() if node_filter(self.docs[node_id]["metadata"])}
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def get_node(self, node_id: str) -> TextNode:
+        doc = self.docs[node_id]
+        node = TextNode(id_=node_id, text=doc["text"], metadata=doc["metadata"])
+        if doc["ref_doc_id"]:
+            node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=doc["ref_doc_id"])
+        return node
+
+
+class HybridRetriever(BaseRetriever):
+    # Fuses dense and BM25 results with weighted reciprocal rank fusion. With
+    # vector_retriever=None it only uses the keyword index, so no query embedding is made.
+    def __init__(self, vector_retriever, keyword_index: KeywordIndex, keyword_weight: float = 0.5,
+                 similarity_top_k: int = 2, rrf_k: int = 60, node_filter=None):
+        super().__init__()
+        self.node_filter = node_filter
+        self.vector_retriever = vector_retriever
+        self.keyword_index = keyword_index
+        self.keyword_weight = keyword_weight
+        self.similarity_top_k = similarity_top_k
+        self.rrf_k = rrf_k
+
+    def _retrieve(self, query_bundle):
+        keyword_hits = self.keyword_index.search(query_bundle.query_str, top_k=self.similarity_top_k * 2, node_filter=self.node_filter)
+        if self.vector_retriever is None:
+            return [NodeWithScore(node=self.keyword_index.get_node(node_id), score=score)
+                    for node_id, score in keyword_hits[:self.similarity_top_k]]
+
+        fused = {}
+        nodes = {}
+        for rank, result in enumerate(self.vector_retriever.retrieve(query_bundle)):
+            nodes[result.node.node_id] = result.node
+            fused[result.node.node_id] = (1 - self.keyword_weight) / (self.rrf_k + rank + 1)
+        for rank, (node_id, _) in enumerate(keyword_hits):
+            nodes.setdefault(node_id, None)
+            fused[node_id] = fused.get(node_id, 0.0) + self.keyword_weight / (self.rrf_k + rank + 1)
+
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:self.similarity_top_k]
+        return [NodeWithScore(node=nodes[node_id] or self.keyword_index.get_node(node_id), score=score) for node_id, score in ranked]
+
+
+def rebuild_from_chroma(database_path: str):
+    import chromadb
+    from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+    collection = chromadb.PersistentClient(path=database_path).get_or_create_collection("quickstart")
+    records = collection.get(include=["documents", "metadatas"])
+    index = KeywordIndex(os.path.join(database_path, KEYWORD_INDEX_FILE))
+    index.add_nodes(metadata_dict_to_node(metadata, text=text) for text, metadata in zip(records["documents"], records["metadatas"]))
+    index.save()
+    print(f"Indexed {len(index)} nodes into {index.path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the keyword index from an existing chroma collection without re-embedding")
+    parser.add_argument("--database-path", default=os.path.join(os.path.dirname(__file__), "./index_store"))
+    args = parser.parse_args()
+    rebuild_from_chroma(args.database_path)
+
+
+if __name__ == "__main__":
+    main()
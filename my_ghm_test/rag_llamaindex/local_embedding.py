@@ -0,0 +1,80 @@
+import hashlib
+import math
+import re
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from keyword_index import tokenize
+
+
+_WORD_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def word_tokenizer(text: str):
+    # rough stand-in for the tiktoken encoder, whose vocabulary file is downloaded on first use
+    return _WORD_TOKEN.findall(text)
+
+
+class HashingEmbedding(BaseEmbedding):
+    # Deterministic, offline embedding: the keyword index tokens and their character
+    # n-grams are hashed (signed) into a fixed number of buckets and the result is
+    # l2-normalized. Good enough to compare retrieval setups, not a semantic model.
+    _dimensions: int = PrivateAttr()
+    _ngram_sizes: tuple = PrivateAttr()
+
+    def __init__(self, dimensions: int = 512, ngram_sizes=(3, 4, 5), **kwargs):
+        super().__init__(model_name=f"hashing-{dimensions}", **kwargs)
+        self._dimensions = dimensions
+        self._ngram_sizes = tuple(ngram_sizes)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashingEmbedding"
+
+    def _features(self, text: str):
+        for token in tokenize(text):
+            yield token, 1.0
+            padded = f"<{token}>"
+            for size in self._ngram_sizes:
+                for start in range(len(padded) - size + 1):
+                    yield padded[start:start + size], 0.5
+
+    def _embed(self, text: str):
+        vector = [0.0] * self._dimensions
+        for feature, weight in self._features(text):
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self._dimensions] += weight if digest >> 63 else -weight
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def _get_query_embedding(self, query: str):
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str):
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str):
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts):
+        return [self._embed(text) for text in texts]
+
+
+class HashingEmbedderModel:
+    # Drop-in for EmbedderModelOpenAI (same init_models / embed_model interface) that
+    # needs neither GITHUB_TOKEN nor network access.
+    embed_model = None
+    cache = None
+    dispatcher = None
+
+    def __init__(self, dimensions: int = 512):
+        self.model = f"hashing-{dimensions}"
+        self.dimensions = dimensions
+
+    def init_models(self):
+        from llama_index.core import Settings
+
+        self.embed_model = HashingEmbedding(dimensions=self.dimensions)
+        Settings.embed_model = self.embed_model
+        Settings.tokenizer = word_tokenizer
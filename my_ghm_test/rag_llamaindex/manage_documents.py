@@ -0,0 +1,52 @@
+from embed_and_query import RagBasedBot, Mode, VectorBackend
+from ingest_manifest import IngestManifest
+from model_data import EmbedderModelOpenAI
+import argparse
+import os
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add, replace or remove single documents of the index store without a full re-ingest")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the ingested files and their document ids")
+    for name in ("add", "replace"):
+        command = commands.add_parser(name, help=f"{name} the nodes of one or more files")
+        command.add_argument("paths", nargs="+")
+    remove = commands.add_parser("remove", help="remove the nodes of files or of single documents")
+    remove.add_argument("paths", nargs="*")
+    remove.add_argument("--doc-id", action="append", default=[], help="document id to remove, can be repeated")
+    parser.add_argument("--data-path", help="documents folder the source areas are taken from, by default the one of the last ingest (or ./data)")
+    args = parser.parse_args()
+
+    current_directory = os.path.dirname(__file__)
+    data_base_path = os.path.join(current_directory, "./index_store")
+    manifest = IngestManifest.load(data_base_path)
+    data_path = args.data_path or manifest.data_path or os.path.join(current_directory, "./data")
+
+    if args.command == "list":
+        for path, entry in manifest.files.items():
+            print(f"{path}\n    {', '.join(entry['doc_ids'])}")
+        return
+
+    cache_path = os.path.join(data_base_path, "embedding_cache.sqlite3")
+    embedding_model = EmbedderModelOpenAI(model="text-embedding-3-large", cache_path=cache_path)
+    vector_backend = VectorBackend(os.getenv("RAG_VECTOR_STORE", VectorBackend.CHROMA.value))
+    bot = RagBasedBot(Mode.INGEST, data_path, data_base_path, model_for_embedding=embedding_model, vector_backend=vector_backend)
+
+    if args.command in ("add", "replace"):
+        for path in args.paths:
+            doc_ids = bot.upsert_file(path)
+            print(f"Indexed {path}: {len(doc_ids)} documents")
+    else:
+        if not args.paths and not args.doc_id:
+            parser.error("remove needs at least one path or --doc-id")
+        for path in args.paths:
+            bot.remove_file(path)
+            print(f"Removed {path}")
+        for doc_id in args.doc_id:
+            bot.remove_document(doc_id)
+            print(f"Removed document {doc_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,18 @@
 from enum import Enum
 import sys, os
-from llama_index.llms.azure_inference import AzureAICompletionsModel
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.core import Settings
 
 
 import dotenv
 
 
+DEFAULT_MODELS_ENDPOINT = "https://models.inference.ai.azure.com/"
+
+
+def models_endpoint() -> str:
+    # GITHUB_MODELS_ENDPOINT points every client at another OpenAI compatible server,
+    # e.g. my_ghm_test/mock_models/mock_models_server.py for offline load tests
+    return os.getenv("GITHUB_MODELS_ENDPOINT", DEFAULT_MODELS_ENDPOINT).rstrip("/") + "/"
+
 class ModelRole(Enum):
     QUERY = "Query"
     EMBED = "Embed"
@@ -23,50 +28,59 @@ class Model:
             raise ValueError("GITHUB_TOKEN is not set")
         
         if not isinstance(mode, ModelRole):
-            raise ValueError(f"Invalid mode: {mode}. Expected one of: {[m.value for m in Mode]}")
+            raise ValueError(f"Invalid mode: {mode}. Expected one of: {[m.value for m in ModelRole]}")
         
         if model == "":
             raise ValueError("Model name is required")
         self.model = model
 
   
+    # the sdk imports below are deferred to init_models, so processes that never call
+    # a model (cleanup, maintenance listings) don't pay for loading them
     def init_models(self):
+        from llama_index.core import Settings
+        from llama_index.llms.azure_inference import AzureAICompletionsModel
+
         self.llm_api_key= os.environ["AZURE_INFERENCE_CREDENTIAL"] = os.getenv("GITHUB_TOKEN")
-        self.llm_api_url= os.environ["OPENAI_BASE_URL"] = "https://models.inference.ai.azure.com/"
+        self.llm_api_url= os.environ["OPENAI_BASE_URL"] = models_endpoint()
         self.llm = AzureAICompletionsModel(endpoint=self.llm_api_url, credential=self.llm_api_key, model_name=self.model,)                                           
         Settings.llm = self.llm
 
 
 class EmbedderModelOpenAI(Model):
     embed_model = None
+    cache = None
+    dispatcher = None
     
-    def __init__(self, model: str = ""):
+    def __init__(self, model: str = "", dimensions: int = None, cache_path: str = None, cache_max_entries: int = 20000, max_concurrency: int = 0):
         super().__init__(ModelRole.EMBED, model)             
         self.llm_api_key = os.environ["AZURE_INFERENCE_CREDENTIAL"] = os.getenv("GITHUB_TOKEN")
-        self.llm_api_url= os.environ["OPENAI_BASE_URL"] = "https://models.inference.ai.azure.com/"
+        self.llm_api_url= os.environ["OPENAI_BASE_URL"] = models_endpoint()
         self.model = model
+        self.dimensions = dimensions
+        self.cache_path = cache_path
+        self.cache_max_entries = cache_max_entries
+        self.max_concurrency = max_concurrency
 
     def init_models(self):
-        self.embed_model = OpenAIEmbedding(
-            api_key=self.llm_api_key,api_base=self.llm_api_url, model=self.model)
-        Settings.embed_model = self.embed_model
+        import tiktoken
+        from llama_index.core import Settings
+        from llama_index.embeddings.openai import OpenAIEmbedding
+        from embedding_cache import EmbeddingCache, CachedEmbedding
+        from embedding_dispatcher import DispatchedOpenAIEmbedding
 
-import tiktoken
-class EmbedderModelOpenAI(Model):
-    embed_model = None
-    
-    def __init__(self, model: str = ""):
-        super().__init__(ModelRole.EMBED, model)             
-        self.llm_api_key = os.environ["AZURE_INFERENCE_CREDENTIAL"] = os.getenv("GITHUB_TOKEN")
-        self.llm_api_url= os.environ["OPENAI_BASE_URL"] = "https://models.inference.ai.azure.com/"
-        self.model = model
-
-    def init_models(self):
-        self.embed_model = OpenAIEmbedding(
-            api_key=self.llm_api_key,api_base=self.llm_api_url, model=self.model)
+        tokenizer = tiktoken.encoding_for_model(self.model)
+        if self.max_concurrency:
+            self.embed_model = DispatchedOpenAIEmbedding(tokenizer, max_concurrency=self.max_concurrency,
+                api_key=self.llm_api_key, api_base=self.llm_api_url, model=self.model, dimensions=self.dimensions)
+            self.dispatcher = self.embed_model.dispatcher
+        else:
+            self.embed_model = OpenAIEmbedding(
+                api_key=self.llm_api_key,api_base=self.llm_api_url, model=self.model, dimensions=self.dimensions)
+        if self.cache_path:
+            self.cache = EmbeddingCache(self.cache_path, max_entries=self.cache_max_entries)
+            self.embed_model = CachedEmbedding(self.embed_model, self.cache, dimensions=self.dimensions)
         Settings.embed_model = self.embed_model
-        Settings.tokenizer = tiktoken.encoding_for_model(self.model)
+        Settings.tokenizer = tokenizer
 
-from azure.ai.inference import EmbeddingsClient
-from azure.core.credentials import AzureKeyCredential
 
@@ -0,0 +1,399 @@
+import argparse
+import json
+import os
+from typing import Optional
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+from vector_quantization import CompactCodes, normalize, top_k
+
+
+VECTORS_FILE = "vectors.npy"
+NODES_FILE = "nodes.json"
+CODES_PREFIX = "compact"
+CODES_FILE = "compact.json"
+# metadata keys indexed as a column of codes, so filtering on them (e.g. the routed
+# source areas) is evaluated once per distinct value instead of once per row
+FILTER_KEYS = ("source_area",)
+_MAX_FILTER_COMBINATIONS = 4096
+_SCORE_BLOCK_ROWS = 65536
+
+
+def _matches(value, operator: FilterOperator, expected) -> bool:
+    if operator == FilterOperator.EQ:
+        return value == expected
+    if operator == FilterOperator.NE:
+        return value != expected
+    if operator == FilterOperator.IN:
+        return value in expected
+    if operator == FilterOperator.NIN:
+        return value not in expected
+    raise ValueError(f"Filter operator {operator} is not supported by the numpy vector store")
+
+
+def passes_filters(metadata: dict, filters) -> bool:
+    results = []
+    for metadata_filter in filters.filters:
+        if hasattr(metadata_filter, "filters"):
+            results.append(passes_filters(metadata, metadata_filter))
+        else:
+            results.append(_matches(metadata.get(metadata_filter.key), metadata_filter.operator, metadata_filter.value))
+    return any(results) if filters.condition == FilterCondition.OR else all(results)
+
+
+def filter_keys(filters) -> set:
+    keys = set()
+    for metadata_filter in filters.filters:
+        keys |= filter_keys(metadata_filter) if hasattr(metadata_filter, "filters") else {metadata_filter.key}
+    return keys
+
+
+def column_codes(metadatas, key: str):
+    # (distinct values, uint32 code of each row's value)
+    values = {}
+    codes = np.asarray([values.setdefault(metadata.get(key), len(values)) for metadata in metadatas], dtype="<u4")
+    return list(values), codes
+
+
+def column_mask(columns: dict, filters):
+    # row mask from the code columns, evaluating the filters once per combination of
+    # values instead of once per row; None when they use a key that has no column
+    keys = sorted(filter_keys(filters))
+    if not keys or any(key not in columns for key in keys):
+        return None
+    if not len(columns[keys[0]][1]):
+        return np.zeros(0, dtype=bool)
+    sizes = [max(1, len(columns[key][0])) for key in keys]
+    combined = np.ravel_multi_index([columns[key][1] for key in keys], sizes) if len(keys) > 1 else columns[keys[0]][1]
+    if np.prod(sizes) <= _MAX_FILTER_COMBINATIONS:
+        # few possible combinations: a table over all of them, indexed by the codes
+        combinations, inverse = np.arange(np.prod(sizes)), combined
+    else:
+        combinations, inverse = np.unique(combined, return_inverse=True)
+    allowed = np.asarray([passes_filters({key: columns[key][0][code] for key, code in zip(keys, np.unravel_index(combination, sizes))}, filters)
+                          for combination in combinations], dtype=bool)
+    return allowed[inverse.reshape(-1)]
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    # Flat index: every embedding is a normalized row of one contiguous matrix that is
+    # memory-mapped read-only when loaded, and a query is one matmul plus argpartition.
+    # Node ids, texts and metadata live in a side table with the same row order.
+    # With search_dimensions or a quantization set, queries scan compact codes instead
+    # and only the best rescore_factor * top_k candidates are rescored on the full
+    # vectors; keep_full_vectors=False drops the full matrix (and the rescoring).
+    # Added rows are buffered and joined to the matrix once, before the next query,
+    # deletion or persist, so windowed ingest doesn't copy the matrix per window.
+    stores_text: bool = True
+    flat_metadata: bool = False
+    persist_dir: str
+    dtype: str = "float32"
+    quantization: str = "none"
+    search_dimensions: Optional[int] = None
+    rescore_factor: int = 4
+    keep_full_vectors: bool = True
+
+    _matrix: np.ndarray = PrivateAttr(default=None)
+    _codes: CompactCodes = PrivateAttr(default=None)
+    _ids: list = PrivateAttr(default_factory=list)
+    _ref_doc_ids: list = PrivateAttr(default_factory=list)
+    _texts: list = PrivateAttr(default_factory=list)
+    _metadatas: list = PrivateAttr(default_factory=list)
+    _pending: list = PrivateAttr(default_factory=list)
+    _columns: dict = PrivateAttr(default=None)
+
+    def __init__(self, persist_dir: str, dtype: str = "float32", quantization: str = "none", search_dimensions: int = None,
+                 rescore_factor: int = 4, keep_full_vectors: bool = True, **kwargs):
+        super().__init__(persist_dir=persist_dir, dtype=dtype, quantization=quantization, search_dimensions=search_dimensions,
+                         rescore_factor=rescore_factor, keep_full_vectors=keep_full_vectors, **kwargs)
+        self._load()
+
+    @property
+    def uses_compact_codes(self) -> bool:
+        return self.quantization != "none" or bool(self.search_dimensions)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self):
+        return None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __bool__(self):
+        # StorageContext.from_defaults tests `if vector_store:`, an empty store must not
+        # fall back to llama_index's SimpleVectorStore
+        return True
+
+    @property
+    def vectors(self):
+        self._flush()
+        return self._matrix
+
+    def _load(self):
+        nodes_path = os.path.join(self.persist_dir, NODES_FILE)
+        if not os.path.exists(nodes_path):
+            return
+        with open(nodes_path, "r", encoding="utf-8") as f:
+            table = json.load(f)
+        self._ids = table["ids"]
+        self._ref_doc_ids = table["ref_doc_ids"]
+        self._texts = table["texts"]
+        self._metadatas = table["metadatas"]
+        if not self._ids:
+            return
+        vectors_path = os.path.join(self.persist_dir, VECTORS_FILE)
+        if os.path.exists(vectors_path):
+            self._matrix = np.load(vectors_path, mmap_mode="r")
+        if self.uses_compact_codes:
+            self._codes = self._load_codes()
+
+    def _load_codes(self) -> CompactCodes:
+        # the row count catches codes left behind by rows deleted while quantization was off
+        codes_path = os.path.join(self.persist_dir, CODES_FILE)
+        settings = {"quantization": self.quantization, "dimensions": self.search_dimensions, "rows": len(self._ids)}
+        if os.path.exists(codes_path):
+            with open(codes_path, "r", encoding="utf-8") as f:
+                if json.load(f) == settings:
+                    return CompactCodes.load(os.path.join(self.persist_dir, CODES_PREFIX), self.quantization, self.search_dimensions)
+        if self._matrix is None:
+            raise ValueError(f"The compact codes in {self.persist_dir} don't match {settings} and there are no full vectors to rebuild them")
+        return CompactCodes.encode(self._matrix, self.quantization, self.search_dimensions)
+
+    def add(self, nodes, **add_kwargs):
+        if not nodes:
+            return []
+        self._append_vectors([node.get_embedding() for node in nodes])
+        for node in nodes:
+            self._ids.append(node.node_id)
+            self._ref_doc_ids.append(node.ref_doc_id)
+            self._texts.append(node.get_content())
+            self._metadatas.append(node_to_metadata_dict(node, remove_text=True, flat_metadata=self.flat_metadata))
+        return [node.node_id for node in nodes]
+
+    def _append_vectors(self, embeddings):
+        self._pending.append(normalize(np.asarray(embeddings, dtype=np.float32)))
+        self._columns = None
+
+    def _flush(self):
+        if not self._pending:
+            return
+        vectors = np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]
+        self._pending = []
+        if self.uses_compact_codes:
+            codes = CompactCodes.encode(vectors, self.quantization, self.search_dimensions)
+            if self._codes is None:
+                self._codes = codes
+            else:
+                self._codes.append(codes)
+        if self.keep_full_vectors or not self.uses_compact_codes:
+            vectors = vectors.astype(self.dtype)
+            self._matrix = vectors if self._matrix is None else np.concatenate([self._matrix, vectors])
+
+    def delete(self, ref_doc_id: str, **delete_kwargs):
+        self._keep_rows([i for i, doc_id in enumerate(self._ref_doc_ids) if doc_id != ref_doc_id])
+
+    def delete_nodes(self, node_ids=None, filters=None, **delete_kwargs):
+        drop = set(node_ids or [])
+        self._keep_rows([i for i, node_id in enumerate(self._ids) if node_id not in drop])
+
+    def clear(self):
+        self._keep_rows([])
+
+    def _keep_rows(self, rows):
+        if len(rows) == len(self._ids):
+            return
+        self._flush()
+        self._columns = None
+        if self._matrix is not None:
+            self._matrix = np.asarray(self._matrix)[rows] if rows else None
+        if self._codes is not None:
+            if rows:
+                self._codes.take(rows)
+            else:
+                self._codes = None
+        self._ids = [self._ids[i] for i in rows]
+        self._ref_doc_ids = [self._ref_doc_ids[i] for i in rows]
+        self._texts = [self._texts[i] for i in rows]
+        self._metadatas = [self._metadatas[i] for i in rows]
+
+    def query(self, query: VectorStoreQuery, **kwargs) -> VectorStoreQueryResult:
+        self._flush()
+        rows = self._candidate_rows(query)
+        if not self._ids or query.query_embedding is None or (rows is not None and len(rows) == 0):
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        query_vector = normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        if self._codes is None:
+            scores = self._scores(query_vector, rows)
+            top = top_k(scores, query.similarity_top_k)
+            return self._result(top if rows is None else rows[top], scores[top])
+
+        rescore = self._matrix is not None
+        compact_scores = self._codes.scores(query_vector, rows)
+        top = top_k(compact_scores, query.similarity_top_k * (self.rescore_factor if rescore else 1))
+        candidates = top if rows is None else rows[top]
+        if not rescore:
+            return self._result(candidates, compact_scores[top])
+        # sorted rows keep the reads of the memory-mapped full vectors sequential
+        candidates = np.sort(candidates)
+        scores = self._scores(query_vector, candidates)
+        top = top_k(scores, query.similarity_top_k)
+        return self._result(candidates[top], scores[top])
+
+    def _scores(self, query_vector: np.ndarray, rows=None) -> np.ndarray:
+        matrix = self._matrix if rows is None else self._matrix[rows]
+        if matrix.dtype == np.float32:
+            return matrix @ query_vector
+        # float16 has no BLAS matmul, so score it in float32 blocks
+        return np.concatenate([matrix[start:start + _SCORE_BLOCK_ROWS].astype(np.float32) @ query_vector
+                               for start in range(0, len(matrix), _SCORE_BLOCK_ROWS)])
+
+    def _result(self, rows, scores) -> VectorStoreQueryResult:
+        nodes = [metadata_dict_to_node(self._metadatas[row], text=self._texts[row]) for row in rows]
+        return VectorStoreQueryResult(nodes=nodes, similarities=[float(score) for score in scores], ids=[self._ids[row] for row in rows])
+
+    def _filter_columns(self) -> dict:
+        # built on the first filtered query after the rows change
+        if self._columns is None:
+            self._columns = {key: column_codes(self._metadatas, key) for key in FILTER_KEYS}
+        return self._columns
+
+    def _candidate_rows(self, query: VectorStoreQuery):
+        if not (query.filters or query.doc_ids or query.node_ids):
+            return None
+        mask = column_mask(self._filter_columns(), query.filters) if query.filters else None
+        rows = np.flatnonzero(mask) if mask is not None else np.arange(len(self._ids))
+        doc_ids = set(query.doc_ids or [])
+        node_ids = set(query.node_ids or [])
+        record_filters = query.filters if query.filters and mask is None else None
+        if not (doc_ids or node_ids or record_filters):
+            return rows.astype(np.int64)
+        return np.asarray([i for i in rows
+                           if (not doc_ids or self._ref_doc_ids[i] in doc_ids)
+                           and (not node_ids or self._ids[i] in node_ids)
+                           and (not record_filters or passes_filters(self._metadatas[i], record_filters))], dtype=np.int64)
+
+    def persist(self, persist_path: str = None, fs=None):
+        # the storage context hands every vector store its own json path, this store
+        # always writes into its persist_dir
+        self._flush()
+        os.makedirs(self.persist_dir, exist_ok=True)
+        vectors_path = os.path.join(self.persist_dir, VECTORS_FILE)
+        nodes_path = os.path.join(self.persist_dir, NODES_FILE)
+        if self._matrix is not None:
+            with open(vectors_path + ".tmp", "wb") as f:
+                np.save(f, np.asarray(self._matrix))
+            os.replace(vectors_path + ".tmp", vectors_path)
+        elif os.path.exists(vectors_path):
+            os.remove(vectors_path)
+        if self._codes is not None:
+            self._codes.save(os.path.join(self.persist_dir, CODES_PREFIX))
+            with open(os.path.join(self.persist_dir, CODES_FILE), "w", encoding="utf-8") as f:
+                json.dump({"quantization": self.quantization, "dimensions": self.search_dimensions, "rows": len(self._ids)}, f)
+        with open(nodes_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"ids": self._ids, "ref_doc_ids": self._ref_doc_ids, "texts": self._texts, "metadatas": self._metadatas}, f, ensure_ascii=False)
+        os.replace(nodes_path + ".tmp", nodes_path)
+
+    def add_rows(self, ids, embeddings, texts, metadatas):
+        self._append_vectors(embeddings)
+        self._ids.extend(ids)
+        self._texts.extend(texts)
+        self._metadatas.extend(metadatas)
+        self._ref_doc_ids.extend(metadata.get("ref_doc_id") for metadata in metadatas)
+
+
+def vector_store_options_from_env() -> dict:
+    options = {
+        "dtype": os.getenv("RAG_VECTOR_DTYPE", "float32"),
+        "quantization": os.getenv("RAG_QUANTIZATION", "none"),
+        "keep_full_vectors": os.getenv("RAG_KEEP_FULL_VECTORS", "1") != "0",
+    }
+    if os.getenv("RAG_SEARCH_DIMENSIONS"):
+        options["search_dimensions"] = int(os.environ["RAG_SEARCH_DIMENSIONS"])
+    return options
+
+
+def _chroma_collection(database_path: str):
+    import chromadb
+    return chromadb.PersistentClient(path=database_path).get_or_create_collection("quickstart")
+
+
+def import_from_chroma(database_path: str, dtype: str):
+    collection = _chroma_collection(database_path)
+    records = collection.get(include=["embeddings", "documents", "metadatas"])
+    store = NumpyVectorStore(os.path.join(database_path, "numpy_store"), dtype=dtype)
+    store.clear()
+    store.add_rows(records["ids"], records["embeddings"], records["documents"], records["metadatas"])
+    store.persist()
+    print(f"Copied {len(store)} vectors from the chroma collection into {store.persist_dir}")
+
+
+def compare_with_chroma(database_path: str, queries: int, top_k: int):
+    # uses stored vectors as queries, so no embedding model is needed
+    collection = _chroma_collection(database_path)
+    store = NumpyVectorStore(os.path.join(database_path, "numpy_store"))
+    sample = collection.get(limit=queries, include=["embeddings"])
+    overlaps = []
+    for embedding in sample["embeddings"]:
+        expected = collection.query(query_embeddings=[embedding], n_results=top_k)["ids"][0]
+        found = store.query(VectorStoreQuery(query_embedding=list(embedding), similarity_top_k=top_k)).ids
+        overlaps.append(len(set(expected) & set(found)) / max(1, len(expected)))
+    print(f"Top-{top_k} overlap with chroma over {len(overlaps)} queries: {sum(overlaps) / max(1, len(overlaps)):.3f}")
+
+
+def self_check(data_path: str):
+    # ingest into an empty folder with the numpy backend, offline, then query it back
+    import shutil
+    import tempfile
+    from embed_and_query import RagBasedBot, Mode, VectorBackend
+    from local_embedding import HashingEmbedderModel
+
+    database_path = tempfile.mkdtemp(prefix="numpy_store_check_")
+    try:
+        RagBasedBot(Mode.INGEST, data_path, database_path, model_for_embedding=HashingEmbedderModel(),
+                    vector_backend=VectorBackend.NUMPY).index_data(rec_flag=True)
+        store = NumpyVectorStore(os.path.join(database_path, "numpy_store"))
+        if not len(store):
+            raise SystemExit(f"Check failed: nothing was written to {store.persist_dir}")
+        bot = RagBasedBot(Mode.RETRIEVE, data_path, database_path, model_for_embedding=HashingEmbedderModel(), vector_backend=VectorBackend.NUMPY)
+        fragments = bot._retrieve_embeddings_for_prompt(store._texts[0][:200])
+        if not fragments:
+            raise SystemExit("Check failed: the freshly ingested numpy store returned no fragments")
+        print(f"Check passed: {len(store)} vectors ingested, query returned {len(fragments)} fragments")
+    finally:
+        shutil.rmtree(database_path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the numpy vector store next to the chroma collection")
+    parser.add_argument("command", choices=["import-chroma", "compare", "check"])
+    parser.add_argument("--database-path", default=os.path.join(os.path.dirname(__file__), "./index_store"))
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--data-path", default=os.path.join(os.path.dirname(__file__), "./DataSources"), help="documents the check command ingests")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        self_check(args.data_path)
+    elif args.command == "import-chroma":
+        import_from_chroma(args.database_path, args.dtype)
+    else:
+        compare_with_chroma(args.database_path, args.queries, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
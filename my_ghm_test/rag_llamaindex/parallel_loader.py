@@ -0,0 +1,88 @@
+from collections import deque
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import time
+
+
+# imported once in the forkserver, so each forked worker starts with llama_index and the
+# file readers already loaded instead of paying their import for every file; modules
+# that are not installed are skipped by the forkserver
+_PRELOAD_MODULES = ["llama_index.core", "llama_index.readers.file", "pypdf", "docx2txt", "pandas"]
+
+
+def _parse_file(path: str, conn):
+    try:
+        from llama_index.core import SimpleDirectoryReader
+        documents = SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+        conn.send((True, documents))
+    except Exception as e:
+        conn.send((False, f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+class LoadedFile:
+    def __init__(self, path: str, documents=None, error: str = None, seconds: float = 0.0):
+        self.path = path
+        self.documents = documents or []
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class ParallelDocumentLoader:
+    # Parses every file in its own worker process, at most num_workers at a time, and
+    # yields the results in completion order. A worker that crashes or goes over the
+    # per-file timeout is killed and reported as a failed file, the rest keep going.
+    def __init__(self, num_workers: int = None, file_timeout: float = 300.0):
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.file_timeout = file_timeout
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._context = multiprocessing.get_context(method)
+        if method == "forkserver":
+            self._context.set_forkserver_preload([__name__, *_PRELOAD_MODULES])
+
+    def iter_documents(self, input_files):
+        pending = deque(str(path) for path in input_files)
+        running = {}
+
+        while pending or running:
+            while pending and len(running) < self.num_workers:
+                path = pending.popleft()
+                receiver, sender = self._context.Pipe(duplex=False)
+                process = self._context.Process(target=_parse_file, args=(path, sender), daemon=True)
+                process.start()
+                sender.close()
+                running[receiver] = (process, path, time.monotonic())
+
+            ready = wait(list(running), timeout=self._time_to_next_deadline(running))
+            for receiver in ready:
+                process, path, started = running.pop(receiver)
+                try:
+                    ok, payload = receiver.recv()
+                except EOFError:
+                    ok, payload = False, "worker process exited without a result"
+                receiver.close()
+                process.join()
+                elapsed = time.monotonic() - started
+                yield LoadedFile(path, documents=payload, seconds=elapsed) if ok else LoadedFile(path, error=payload, seconds=elapsed)
+
+            if self.file_timeout is None:
+                continue
+            now = time.monotonic()
+            for receiver in [r for r, (_, _, started) in running.items() if now - started > self.file_timeout]:
+                process, path, started = running.pop(receiver)
+                process.terminate()
+                process.join()
+                receiver.close()
+                yield LoadedFile(path, error=f"timed out after {self.file_timeout:.0f}s", seconds=now - started)
+
+    def _time_to_next_deadline(self, running):
+        if self.file_timeout is None or not running:
+            return None
+        oldest = min(started for _, _, started in running.values())
+        return max(0.0, oldest + self.file_timeout - time.monotonic())
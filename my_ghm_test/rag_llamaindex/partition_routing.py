@@ -0,0 +1,74 @@
+import json
+import os
+
+from llama_index.core.vector_stores.types import FilterOperator, MetadataFilter, MetadataFilters
+
+from keyword_index import tokenize
+
+
+SOURCE_AREA_KEY = "source_area"
+# documents placed directly in the data folder, outside any area folder
+ROOT_AREA = "general"
+
+DEFAULT_AREA_KEYWORDS = {
+    "Catedra": ["materia", "curso", "da1", "fis", "diseño de aplicaciones", "fundamentos de ingeniería de software", "temario",
+                "bibliografía", "cronograma", "hoja de ruta", "acuerdos", "requisitos previos", "clase", "teórico",
+                "tecnología", "investigación"],
+    "Reglamentos": ["reglamento", "reglamentación", "evaluación", "parcial", "examen", "aprobación", "aprobar", "nsp", "honestidad",
+                    "plagio", "supervisión", "encuesta", "reglamento docente", "pautas", "gestión de cátedra"],
+    "TemplatesFI": ["plantilla", "planilla", "formulario", "template", "suplencia", "envío", "formato"],
+}
+
+
+def source_area(file_path: str, data_root: str) -> str:
+    # the first folder under the data root, e.g. DataSources/Reglamentos/x.pdf -> Reglamentos
+    relative = os.path.relpath(os.path.abspath(file_path), data_root)
+    parts = relative.split(os.sep)
+    if len(parts) < 2 or parts[0] == os.pardir:
+        return ROOT_AREA
+    return parts[0]
+
+
+def tag_documents(documents, data_root: str):
+    # the area is only used to filter, it is kept out of the embedded and the llm text
+    for document in documents:
+        document.metadata[SOURCE_AREA_KEY] = source_area(document.metadata.get("file_path", ""), data_root)
+        for keys in (document.excluded_embed_metadata_keys, document.excluded_llm_metadata_keys):
+            if SOURCE_AREA_KEY not in keys:
+                keys.append(SOURCE_AREA_KEY)
+    return documents
+
+
+def area_filters(areas) -> MetadataFilters:
+    if len(areas) == 1:
+        return MetadataFilters(filters=[MetadataFilter(key=SOURCE_AREA_KEY, value=areas[0], operator=FilterOperator.EQ)])
+    return MetadataFilters(filters=[MetadataFilter(key=SOURCE_AREA_KEY, value=list(areas), operator=FilterOperator.IN)])
+
+
+class QueryRouter:
+    # Scores each area by the keyword terms (tokenized like the keyword index) found in
+    # the question and returns every area that reaches min_score, so a question that
+    # mentions two areas searches both; None means search every area.
+    def __init__(self, area_keywords: dict = None, min_score: int = 1):
+        self.min_score = min_score
+        self.area_terms = {}
+        for area, keywords in (area_keywords or DEFAULT_AREA_KEYWORDS).items():
+            self.area_terms[area] = [tuple(tokenize(keyword)) for keyword in keywords if tokenize(keyword)]
+
+    @classmethod
+    def load(cls, path: str = None):
+        # json object {"Area": ["keyword", ...]}, the built-in keywords when no path is given
+        if not path:
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def scores(self, question: str) -> dict:
+        tokens = tokenize(question)
+        text = " " + " ".join(tokens) + " "
+        return {area: sum(1 for terms in area_terms if f" {' '.join(terms)} " in text)
+                for area, area_terms in self.area_terms.items()}
+
+    def route(self, question: str):
+        areas = sorted(area for area, score in self.scores(question).items() if score >= self.min_score)
+        return areas or None
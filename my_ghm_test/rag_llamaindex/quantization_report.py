@@ -0,0 +1,80 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from numpy_vector_store import NumpyVectorStore
+from vector_quantization import CompactCodes, normalize, top_k
+
+
+DEFAULT_CONFIGS = "int8,binary,none:1024,int8:1024,binary:1024,int8:256"
+
+
+def parse_config(config: str):
+    quantization, _, dimensions = config.partition(":")
+    return quantization, int(dimensions) if dimensions else None
+
+
+def load_queries(args, vectors: np.ndarray):
+    if args.questions:
+        from model_data import EmbedderModelOpenAI
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+        embedding_model = EmbedderModelOpenAI(model=args.model)
+        embedding_model.init_models()
+        return normalize(np.asarray(embedding_model.embed_model.get_text_embedding_batch(questions), dtype=np.float32)), None
+    # without questions, stored vectors are used as queries and their own row is left out
+    rows = np.random.default_rng(args.seed).choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    return np.asarray(vectors[rows], dtype=np.float32), rows
+
+
+def recall(expected, found) -> float:
+    return len(set(expected) & set(found)) / max(1, len(expected))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recall and size of compact embedding codes against the full precision numpy index")
+    parser.add_argument("--database-path", default=os.path.join(os.path.dirname(__file__), "./index_store"))
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS, help="comma separated quantization[:dimensions] list")
+    parser.add_argument("--questions", help="text file with one question per line, embedded with --model")
+    parser.add_argument("--model", default="text-embedding-3-large")
+    parser.add_argument("--queries", type=int, default=200, help="stored vectors sampled as queries when no questions are given")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    store = NumpyVectorStore(os.path.join(args.database_path, "numpy_store"))
+    if store.vectors is None:
+        raise SystemExit("The numpy store has no full precision vectors, run numpy_vector_store.py import-chroma first")
+    vectors = np.asarray(store.vectors, dtype=np.float32)
+    queries, query_rows = load_queries(args, vectors)
+    extra = 0 if query_rows is None else 1
+
+    def exclude_self(ranked, i):
+        return [row for row in ranked if query_rows is None or row != query_rows[i]][:args.top_k]
+
+    truth = [exclude_self(top_k(vectors @ query, args.top_k + extra), i) for i, query in enumerate(queries)]
+    print(f"{len(vectors)} vectors of {vectors.shape[1]} dims, {len(queries)} queries, recall@{args.top_k}")
+    print(f"{'config':<16}{'bytes/vec':>10}{'index MB':>10}{'recall':>9}{'rescored':>10}{'ms/query':>10}")
+    print(f"{'float32 full':<16}{vectors.shape[1] * 4:>10}{vectors.nbytes / 2**20:>10.1f}{1.0:>9.3f}{1.0:>10.3f}{'':>10}")
+
+    for config in args.configs.split(","):
+        quantization, dimensions = parse_config(config)
+        codes = CompactCodes.encode(vectors, quantization, dimensions)
+        plain, rescored = [], []
+        started = time.perf_counter()
+        for i, query in enumerate(queries):
+            scores = codes.scores(query)
+            plain.append(recall(truth[i], exclude_self(top_k(scores, args.top_k + extra), i)))
+            candidates = np.sort(top_k(scores, (args.top_k + extra) * args.rescore_factor))
+            full_scores = vectors[candidates] @ query
+            rescored.append(recall(truth[i], exclude_self(candidates[top_k(full_scores, args.top_k + extra)], i)))
+        elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        print(f"{config:<16}{codes.nbytes // len(codes):>10}{codes.nbytes / 2**20:>10.1f}"
+              f"{np.mean(plain):>9.3f}{np.mean(rescored):>10.3f}{elapsed_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,61 @@
-from embed_and_query import RagBasedBot, Mode
+from embed_and_query import RagBasedBot, Mode, VectorBackend, RetrievalMode
 from model_data import Model, EmbedderModelOpenAI, ModelRole
+from answer_cache import AnswerCache
+from reranking import create_reranker
+from instrumentation import instrumentation_from_env
+from partition_routing import QueryRouter
+from request_gate import RequestGate, ServerBusyError, RequestTimeoutError
 import os
-import gradio as gr
 
 
-def ask(question:str, history=[["", ""]]):
-    
-    response = bot.retrieve_answer(question)
-    return response
+async def ask(question:str, history=[["", ""]]):
+    # gradio re-renders the message with every yielded value, so the text accumulates
+    response = ""
+    try:
+        async for token in gate.stream(lambda: bot.aretrieve_answer_stream(question)):
+            response += token
+            yield response
+    except ServerBusyError:
+        yield "Hay muchas consultas en curso en este momento, por favor intenta de nuevo en unos segundos."
+    except RequestTimeoutError:
+        yield response + "\n\n(La respuesta tardó demasiado y fue interrumpida, por favor intenta de nuevo.)"
     
 
 bot = None 
+gate = None
 history = ""
 
 def main():
-    global bot, history
+    import gradio as gr
+
+    global bot, history, gate
     history = []
     
     current_directory = os.path.dirname(__file__)
     data_path = os.path.join(current_directory, "./data")
     data_base_path = os.path.join(current_directory, "./index_store")
     
+    cache_path = os.path.join(data_base_path, "embedding_cache.sqlite3")
+    
     query_model = Model(ModelRole.QUERY, "gpt-4o-mini")
-    embedding_model = EmbedderModelOpenAI(model="text-embedding-3-large")
-    bot = RagBasedBot(mode=Mode.RETRIEVE, data_path=data_path, database_path=data_base_path, model_for_query=query_model, model_for_embedding=embedding_model)
+    embedding_model = EmbedderModelOpenAI(model="text-embedding-3-large", cache_path=cache_path)
+    vector_backend = VectorBackend(os.getenv("RAG_VECTOR_STORE", VectorBackend.CHROMA.value))
+    retrieval_mode = RetrievalMode(os.getenv("RAG_RETRIEVAL_MODE", RetrievalMode.VECTOR.value))
+    bypass_margin = os.getenv("RAG_RERANK_BYPASS_MARGIN")
+    rerank_batch = os.getenv("RAG_RERANK_BATCH")
+    reranker = create_reranker(os.getenv("RAG_RERANKER", ""), candidate_k=int(os.getenv("RAG_RERANK_CANDIDATES", "8")),
+                               latency_budget=float(os.getenv("RAG_RERANK_BUDGET_MS", "300")) / 1000,
+                               batch_size=int(rerank_batch) if rerank_batch else None,
+                               bypass_margin=float(bypass_margin) if bypass_margin else None)
+    answer_cache = None
+    if os.getenv("RAG_ANSWER_CACHE", "1") != "0":
+        answer_cache = AnswerCache(max_entries=int(os.getenv("RAG_ANSWER_CACHE_SIZE", "256")), ttl_seconds=float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600")),
+                                   similarity_threshold=float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95")))
+    bot = RagBasedBot(mode=Mode.RETRIEVE, data_path=data_path, database_path=data_base_path, model_for_query=query_model, model_for_embedding=embedding_model, vector_backend=vector_backend,
+                      retrieval_mode=retrieval_mode, keyword_weight=float(os.getenv("RAG_KEYWORD_WEIGHT", "0.5")), answer_cache=answer_cache,
+                      context_token_budget=int(os.getenv("RAG_CONTEXT_TOKENS", "3000")), reranker=reranker,
+                      instrumentation=instrumentation_from_env(),
+                      router=QueryRouter.load(os.getenv("RAG_ROUTER_KEYWORDS")) if os.getenv("RAG_ROUTING", "0") != "0" else None)
 
     #while True:
     #    prompt = input("/n/nQué pregunta tienes (o Enter para salir): ")
@@ -33,9 +65,15 @@ def main():
     #    print(response)
         
         
+    max_concurrent = int(os.getenv("RAG_MAX_CONCURRENT", "16"))
+    gate = RequestGate(max_concurrent=max_concurrent, max_waiting=int(os.getenv("RAG_MAX_WAITING", "64")),
+                       queue_timeout=float(os.getenv("RAG_QUEUE_TIMEOUT", "30")), request_timeout=float(os.getenv("RAG_REQUEST_TIMEOUT", "120")))
+        
     ui = gr.ChatInterface(fn=ask, textbox=gr.Textbox(placeholder="Soy <Async> y puedes preguntar sobre reglamentos y procedimientos de la facultad, asi como también sobre las materias de Diseño de Aplicaciones 1 y Fundamentos de ingeniería", container=True, max_lines=10), title="Async - el chatbot de la cátedra de IngSoft",
                          examples=["¿Qué se dicta en diseño de aplicaciones 1 (DA1)?", "¿Qué se dicta en Fundamentos de Ingeniería de Software (FIS)?", "¿Qué es un obligatorio?", "¿Como se aprueba un parcial de una materia?", "¿Que significa el resultado NSP?", "Como aviso de una suplencia docente"],
                            clear_btn="Clear",retry_btn=None, undo_btn=None)
+    # gradio's own queue only hands requests to the event loop, the gate above does the admission control
+    ui.queue(default_concurrency_limit=max_concurrent + gate.max_waiting)
     ui.launch(share=True)
     
 
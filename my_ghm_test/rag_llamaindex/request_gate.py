@@ -0,0 +1,86 @@
+import asyncio
+
+
+class ServerBusyError(Exception):
+    pass
+
+
+class RequestTimeoutError(Exception):
+    pass
+
+
+class RequestGate:
+    # Admission control for the async chat path: at most max_concurrent requests run at
+    # once, at most max_waiting wait for a slot (the rest are rejected right away), a
+    # waiting request gives up after queue_timeout and a running one after request_timeout.
+    def __init__(self, max_concurrent: int = 16, max_waiting: int = 64, queue_timeout: float = 30.0, request_timeout: float = 120.0):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+    async def _acquire(self):
+        if not self._slots.locked():
+            await self._slots.acquire()
+            self.active += 1
+            self.admitted += 1
+            return
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise ServerBusyError(f"{self.waiting} requests already waiting")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ServerBusyError(f"no free slot after {self.queue_timeout}s")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.admitted += 1
+
+    def _release(self):
+        self.active -= 1
+        self._slots.release()
+
+    async def run(self, coroutine_factory):
+        await self._acquire()
+        try:
+            return await asyncio.wait_for(coroutine_factory(), self.request_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise RequestTimeoutError(f"request took longer than {self.request_timeout}s")
+        finally:
+            self._release()
+
+    async def stream(self, stream_factory):
+        # same as run() for async generators, the timeout covers the whole stream
+        await self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.request_timeout
+            stream = stream_factory()
+            try:
+                while True:
+                    try:
+                        item = await asyncio.wait_for(stream.__anext__(), max(0.0, deadline - loop.time()))
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        self.timed_out += 1
+                        raise RequestTimeoutError(f"request took longer than {self.request_timeout}s")
+                    yield item
+            finally:
+                await stream.aclose()
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {"active": self.active, "waiting": self.waiting, "admitted": self.admitted,
+                "rejected": self.rejected, "timed_out": self.timed_out}
@@ -0,0 +1,114 @@
+import logging
+import time
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+from keyword_index import tokenize
+
+
+# gap between the scores given to candidates left unscored when the budget runs out
+_UNSCORED_STEP = 1e-3
+
+class LexicalScorer:
+    # Cheap local scorer: share of the query terms found in the fragment, blended with
+    # the retrieval score (the embedding similarity for dense retrieval) rescaled to [0, 1].
+    def __init__(self, lexical_weight: float = 0.5):
+        self.lexical_weight = lexical_weight
+
+    def score_batch(self, query: str, candidates):
+        query_terms = set(tokenize(query))
+        scores = [candidate.score if candidate.score is not None else 0.0 for candidate in candidates]
+        low, high = min(scores), max(scores)
+        results = []
+        for candidate, score in zip(candidates, scores):
+            terms = set(tokenize(candidate.node.get_content(metadata_mode=MetadataMode.NONE)))
+            coverage = len(query_terms & terms) / len(query_terms) if query_terms else 0.0
+            retrieval = (score - low) / (high - low) if high > low else 1.0
+            results.append(self.lexical_weight * coverage + (1 - self.lexical_weight) * retrieval)
+        return results
+
+
+class CrossEncoderScorer:
+    # Small cross-encoder (e.g. a MiniLM ms-marco model) loaded from a local directory and
+    # run on the CPU; sentence-transformers is only imported when this scorer is used.
+    def __init__(self, model_path: str, max_length: int = 512):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_path, device="cpu", max_length=max_length)
+
+    def score_batch(self, query: str, candidates):
+        pairs = [(query, candidate.node.get_content(metadata_mode=MetadataMode.NONE)) for candidate in candidates]
+        return [float(score) for score in self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)]
+
+
+class Reranker:
+    # Rescores a wider candidate set in batches and keeps the best top_n. Scoring stops
+    # once latency_budget seconds are spent (unscored candidates keep their retrieval
+    # order behind the scored ones, with scores just below the lowest reranked one so
+    # the two scales are never mixed downstream), and is skipped when the retrieval
+    # scores already separate the first top_n from the rest by at least bypass_margin.
+    # The budget is checked between batches, so the first batch always runs; batches
+    # default to a quarter of candidate_k to leave the budget something to cut.
+    def __init__(self, scorer, top_n: int = 2, candidate_k: int = 8, batch_size: int = None,
+                 latency_budget: float = 0.3, bypass_margin: float = None):
+        self.scorer = scorer
+        self.top_n = top_n
+        self.candidate_k = candidate_k
+        self.batch_size = batch_size or max(1, candidate_k // 4)
+        self.latency_budget = latency_budget
+        self.bypass_margin = bypass_margin
+        self.reranked = 0
+        self.bypassed = 0
+        self.over_budget = 0
+
+    def _is_confident(self, candidates) -> bool:
+        if len(candidates) <= self.top_n:
+            return True
+        if self.bypass_margin is None:
+            return False
+        scores = [candidate.score if candidate.score is not None else 0.0 for candidate in candidates]
+        return scores[self.top_n - 1] - scores[self.top_n] >= self.bypass_margin
+
+    def rerank(self, query: str, candidates):
+        if self._is_confident(candidates):
+            self.bypassed += 1
+            return candidates[:self.top_n]
+
+        started = time.perf_counter()
+        scored = []
+        for start in range(0, len(candidates), self.batch_size):
+            if scored and time.perf_counter() - started > self.latency_budget:
+                self.over_budget += 1
+                logging.info(f"Reranking stopped after {len(scored)} of {len(candidates)} candidates, latency budget spent")
+                break
+            batch = candidates[start:start + self.batch_size]
+            scored.extend(zip(batch, self.scorer.score_batch(query, batch)))
+        self.reranked += 1
+
+        ranked = [NodeWithScore(node=candidate.node, score=score) for candidate, score in sorted(scored, key=lambda item: item[1], reverse=True)]
+        lowest = ranked[-1].score
+        ranked.extend(NodeWithScore(node=candidate.node, score=lowest - (i + 1) * _UNSCORED_STEP)
+                      for i, candidate in enumerate(candidates[len(scored):self.top_n]))
+        return ranked[:self.top_n]
+
+    def stats(self) -> dict:
+        return {"reranked": self.reranked, "bypassed": self.bypassed, "over_budget": self.over_budget}
+
+
+class RerankingRetriever(BaseRetriever):
+    def __init__(self, retriever, reranker: Reranker):
+        super().__init__()
+        self.retriever = retriever
+        self.reranker = reranker
+
+    def _retrieve(self, query_bundle):
+        return self.reranker.rerank(query_bundle.query_str, self.retriever.retrieve(query_bundle))
+
+
+def create_reranker(name: str, top_n: int = 2, **kwargs):
+    # "lexical" or the path of a local cross-encoder model; empty means no reranking
+    if not name:
+        return None
+    scorer = LexicalScorer() if name == "lexical" else CrossEncoderScorer(name)
+    return Reranker(scorer, top_n=top_n, **kwargs)
@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from embed_and_query import RagBasedBot, Mode, VectorBackend, RetrievalMode
+from local_embedding import HashingEmbedderModel
+from reranking import create_reranker
+from partition_routing import QueryRouter
+
+
+def percentiles(seconds) -> dict:
+    if not seconds:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(np.asarray(seconds) * 1000, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def create_embedder(args):
+    if not args.real:
+        return HashingEmbedderModel(dimensions=args.dimensions)
+    from model_data import EmbedderModelOpenAI
+    return EmbedderModelOpenAI(model=args.model, cache_path=args.cache_path)
+
+
+def ingest(args, database_path: str):
+    # one index_data run like Ingest.py; upserting file by file would persist the whole index once per file.
+    # Streamed in one file windows, so the time between window commits is the time of each file
+    bot = RagBasedBot(Mode.INGEST, args.data_path, database_path, model_for_embedding=create_embedder(args), vector_backend=VectorBackend(args.vector_store))
+    files = sorted(os.path.join(root, name) for root, _, names in os.walk(args.data_path) for name in names if not name.startswith("."))
+    started = time.perf_counter()
+    bot.index_data(rec_flag=True, window_nodes=1)
+    return files, time.perf_counter() - started, bot.last_ingest_progress.window_seconds
+
+
+def evaluate(args, database_path: str, questions):
+    bot = RagBasedBot(Mode.RETRIEVE, args.data_path, database_path, model_for_embedding=create_embedder(args),
+                      vector_backend=VectorBackend(args.vector_store), retrieval_mode=RetrievalMode(args.retrieval_mode),
+                      similarity_top_k=args.top_k, reranker=create_reranker(args.reranker, top_n=args.top_k),
+                      router=QueryRouter() if args.routing else None)
+    bot._retrieve_embeddings_for_prompt(questions[0]["question"])
+    seconds, recalls, reciprocal_ranks, misses = [], [], [], []
+    for item in questions:
+        started = time.perf_counter()
+        fragments = bot._retrieve_embeddings_for_prompt(item["question"])
+        seconds.append(time.perf_counter() - started)
+        found = [fragment.node.metadata.get("file_name") for fragment in fragments]
+        expected = set(item["expected"])
+        recalls.append(len(expected & set(found)) / len(expected))
+        rank = next((i + 1 for i, file_name in enumerate(found) if file_name in expected), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        if rank is None:
+            misses.append({"question": item["question"], "expected": item["expected"], "found": found})
+    return {f"recall@{args.top_k}": float(np.mean(recalls)), "mrr": float(np.mean(reciprocal_ranks)),
+            "query": percentiles(seconds), "misses": misses}
+
+
+def main():
+    current_directory = os.path.dirname(__file__)
+    parser = argparse.ArgumentParser(description="Measure retrieval quality and latency over the bundled corpus, offline by default")
+    parser.add_argument("--data-path", default=os.path.join(current_directory, "DataSources"))
+    parser.add_argument("--questions", default=os.path.join(current_directory, "benchmark_questions.json"))
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--vector-store", choices=[VectorBackend.CHROMA.value, VectorBackend.NUMPY.value], default=VectorBackend.NUMPY.value)
+    parser.add_argument("--retrieval-mode", choices=[mode.value for mode in RetrievalMode], default=RetrievalMode.VECTOR.value)
+    parser.add_argument("--reranker", default="", help='"lexical" or the path of a local cross-encoder model')
+    parser.add_argument("--routing", action="store_true", help="route each question to its source areas before searching")
+    parser.add_argument("--dimensions", type=int, default=512, help="size of the hashing embedding")
+    parser.add_argument("--real", action="store_true", help="use the GitHub Models embedder instead of the hashing one, needs GITHUB_TOKEN")
+    parser.add_argument("--model", default="text-embedding-3-large")
+    parser.add_argument("--cache-path", default=os.path.join(current_directory, "index_store", "embedding_cache.sqlite3"),
+                        help="embedding cache for --real runs, so repeated runs don't embed the corpus again")
+    parser.add_argument("--index-path", help="keep the benchmark index here instead of a temporary directory")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    args = parser.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    database_path = args.index_path or tempfile.mkdtemp(prefix="rag_benchmark_")
+    try:
+        files, ingest_seconds, file_seconds = ingest(args, database_path)
+        results = {"embedder": "real" if args.real else f"hashing-{args.dimensions}", "vector_store": args.vector_store,
+                   "retrieval_mode": args.retrieval_mode, "reranker": args.reranker or None, "routing": args.routing, "files": len(files),
+                   "questions": len(questions), "ingest": {"total_s": ingest_seconds, **percentiles(file_seconds)}}
+        results.update(evaluate(args, database_path, questions))
+    finally:
+        if not args.index_path:
+            shutil.rmtree(database_path, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+    print(f"{results['files']} files, {results['questions']} questions, {results['embedder']} embedder, "
+          f"{args.vector_store} store, {args.retrieval_mode} retrieval" + (f", {args.reranker} reranker" if args.reranker else ""))
+    print(f"recall@{args.top_k} {results[f'recall@{args.top_k}']:.3f}  MRR {results['mrr']:.3f}")
+    timings = results["ingest"]
+    print(f"ingest  {timings['total_s']:.2f} s, per file p50 {timings['p50_ms']:.1f} ms  p95 {timings['p95_ms']:.1f} ms  p99 {timings['p99_ms']:.1f} ms")
+    timings = results["query"]
+    print(f"query   p50 {timings['p50_ms']:.1f} ms  p95 {timings['p95_ms']:.1f} ms  p99 {timings['p99_ms']:.1f} ms")
+    for miss in results["misses"]:
+        print(f"miss: {miss['question']} -> {miss['found']}")
+
+
+if __name__ == "__main__":
+    main()
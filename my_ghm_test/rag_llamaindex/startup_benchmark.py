@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+
+ENTRY_POINTS = ("rag_bot", "Ingest", "delete_embeddings", "manage_documents")
+
+_IMPORT_CHILD = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+_FIRST_QUERY_CHILD = """
+import json, os, sys, time
+started = time.perf_counter()
+from embed_and_query import RagBasedBot, Mode, VectorBackend, RetrievalMode
+from model_data import Model, EmbedderModelOpenAI, ModelRole
+imported = time.perf_counter()
+current_directory = os.getcwd()
+bot = RagBasedBot(Mode.RETRIEVE, os.path.join(current_directory, "data"), os.path.join(current_directory, "index_store"),
+                  model_for_query=Model(ModelRole.QUERY, "gpt-4o-mini"), model_for_embedding=EmbedderModelOpenAI(model="text-embedding-3-large"),
+                  vector_backend=VectorBackend(os.getenv("RAG_VECTOR_STORE", VectorBackend.CHROMA.value)),
+                  retrieval_mode=RetrievalMode(os.getenv("RAG_RETRIEVAL_MODE", RetrievalMode.VECTOR.value)))
+loaded = time.perf_counter()
+bot.retrieve_answer(sys.argv[1])
+answered = time.perf_counter()
+print(json.dumps({"import": imported - started, "load": loaded - imported, "first_query": answered - loaded, "total": answered - started}))
+"""
+
+
+def run_child(code: str, interpreter_args=(), script_args=()):
+    # every measurement runs in a fresh interpreter, otherwise the modules are already loaded
+    result = subprocess.run([sys.executable, *interpreter_args, "-c", code, *script_args], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit code {result.returncode}")
+    return result
+
+
+def import_seconds(module: str, repeat: int):
+    return [float(run_child(_IMPORT_CHILD.format(module=module)).stdout.strip().splitlines()[-1]) for _ in range(repeat)]
+
+
+def heaviest_imports(module: str, count: int):
+    # cumulative microseconds of the packages the entry point imports directly, from python -X importtime
+    stderr = run_child(f"import {module}", interpreter_args=("-X", "importtime")).stderr
+    totals = {}
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match and len(match.group(2)) == 3:
+            package = match.group(3).split(".")[0]
+            totals[package] = totals.get(package, 0) + int(match.group(1))
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of each entry point and, optionally, the first query latency of the bot")
+    parser.add_argument("--entry-points", default=",".join(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5, help="heaviest top level imports listed per entry point")
+    parser.add_argument("--first-query", help="question answered by a freshly started bot, needs GITHUB_TOKEN and an index")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    args = parser.parse_args()
+
+    results = {}
+    for module in args.entry_points.split(","):
+        seconds = import_seconds(module, args.repeat)
+        results[module] = {"import_min": min(seconds), "import_median": statistics.median(seconds),
+                           "heaviest": heaviest_imports(module, args.top) if args.top else []}
+    if args.first_query:
+        results["first_query"] = json.loads(run_child(_FIRST_QUERY_CHILD, script_args=(args.first_query,)).stdout.strip().splitlines()[-1])
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for module in args.entry_points.split(","):
+        result = results[module]
+        heaviest = ", ".join(f"{package} {microseconds / 1e6:.2f}s" for package, microseconds in result["heaviest"])
+        print(f"{module:<20} import {result['import_min']:.2f}s (median {result['import_median']:.2f}s)  {heaviest}")
+    if args.first_query:
+        timings = results["first_query"]
+        print(f"{'first query':<20} import {timings['import']:.2f}s, load {timings['load']:.2f}s, "
+              f"answer {timings['first_query']:.2f}s, total {timings['total']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import logging
+import queue
+import threading
+import time
+
+
+_END = object()
+
+
+def prefetch(iterable, max_buffered: int = 2):
+    # Runs the iterable in a background thread and hands its items over through a
+    # bounded queue, so the producer blocks once max_buffered items are waiting.
+    items = queue.Queue(maxsize=max_buffered)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put(item, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            items.put(_END)
+        except BaseException as e:
+            items.put(e)
+
+    producer = threading.Thread(target=produce, name="ingest-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+class IngestWindow:
+    # Nodes waiting to be embedded and upserted together with the files they come
+    # from; a file is only checkpointed once every one of its nodes is committed.
+    def __init__(self, max_nodes: int):
+        self.max_nodes = max_nodes
+        self.nodes = []
+        self.files = []
+        self.documents = []
+
+    def add(self, loaded_files, documents, nodes):
+        self.files.extend(loaded_files)
+        self.documents.extend(documents)
+        self.nodes.extend(nodes)
+
+    def is_full(self) -> bool:
+        return len(self.nodes) >= self.max_nodes
+
+    def is_empty(self) -> bool:
+        return not self.files and not self.nodes
+
+
+class CheckpointSchedule:
+    # A checkpoint persists the whole index (docstore, keyword index, vectors), so taking
+    # one after every window makes ingest quadratic in the corpus size. One is taken once
+    # the nodes committed since the last checkpoint reach the number already persisted
+    # (and at least one window), which keeps the total persist work linear and loses at
+    # most half of the committed nodes on a crash; the embedding cache makes those cheap.
+    def __init__(self, min_nodes: int):
+        self.min_nodes = min_nodes
+        self.persisted = 0
+        self.pending = 0
+
+    def add(self, nodes: int):
+        self.pending += nodes
+
+    def is_due(self) -> bool:
+        return self.pending >= max(self.min_nodes, self.persisted)
+
+    def done(self):
+        self.persisted += self.pending
+        self.pending = 0
+
+
+class IngestProgress:
+    def __init__(self, total_files: int):
+        self.total_files = total_files
+        self.files = 0
+        self.nodes = 0
+        self.windows = 0
+        # seconds between consecutive commits, the per file ingest time with one file windows
+        self.window_seconds = []
+        self.started = time.monotonic()
+        self._last_commit = self.started
+
+    def committed(self, window: IngestWindow):
+        self.files += len(window.files)
+        self.nodes += len(window.nodes)
+        self.windows += 1
+        now = time.monotonic()
+        self.window_seconds.append(now - self._last_commit)
+        self._last_commit = now
+        elapsed = now - self.started
+        logging.info(f"Committed window {self.windows}: {self.files}/{self.total_files} files, "
+                     f"{self.nodes} nodes, {self.nodes / elapsed if elapsed else 0.0:.1f} nodes/s")
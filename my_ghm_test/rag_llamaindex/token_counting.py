@@ -0,0 +1,10 @@
+def count_tokens(text: str, tokenizer=None) -> int:
+    if tokenizer is None:
+        from llama_index.core import Settings
+        tokenizer = Settings.tokenizer
+    # tiktoken encoders are not callable and refuse special tokens found in plain text
+    if hasattr(tokenizer, "encode_ordinary"):
+        return len(tokenizer.encode_ordinary(text))
+    if hasattr(tokenizer, "encode"):
+        return len(tokenizer.encode(text))
+    return len(tokenizer(text))
@@ -0,0 +1,108 @@
+import os
+
+import numpy as np
+
+
+QUANTIZATIONS = ("none", "int8", "binary")
+_BLOCK_ROWS = 65536
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def truncate(vectors: np.ndarray, dimensions: int = None) -> np.ndarray:
+    # text-embedding-3 models are trained so that a prefix of the vector is itself a
+    # usable embedding once it is re-normalized
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dimensions:
+        vectors = vectors[..., :dimensions]
+    return normalize(vectors)
+
+
+class CompactCodes:
+    # Reduced form of the embedding matrix that is scanned for every query: a
+    # truncated prefix of each vector, optionally stored as int8 (one scale per row)
+    # or as sign bits compared by hamming distance.
+    def __init__(self, quantization: str, dimensions: int, codes: np.ndarray, scales: np.ndarray = None):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Invalid quantization: {quantization}. Expected one of: {QUANTIZATIONS}")
+        self.quantization = quantization
+        self.dimensions = dimensions
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def encode(cls, vectors, quantization: str = "none", dimensions: int = None):
+        vectors = truncate(vectors, dimensions)
+        if quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.round(vectors / scales[:, None]).astype(np.int8)
+            return cls(quantization, dimensions, codes, scales.astype(np.float32))
+        if quantization == "binary":
+            return cls(quantization, dimensions, np.packbits(vectors > 0, axis=1))
+        return cls(quantization, dimensions, vectors.astype(np.float16))
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def append(self, other):
+        self.codes = np.concatenate([self.codes, other.codes])
+        if self.scales is not None:
+            self.scales = np.concatenate([self.scales, other.scales])
+
+    def take(self, rows):
+        self.codes = np.asarray(self.codes)[rows]
+        if self.scales is not None:
+            self.scales = np.asarray(self.scales)[rows]
+
+    def scores(self, query_vector, rows=None) -> np.ndarray:
+        codes = self.codes if rows is None else self.codes[rows]
+        query = truncate(query_vector, self.dimensions)
+        if self.quantization == "binary":
+            query_bits = np.packbits(query > 0)
+            distances = np.concatenate([_POPCOUNT[np.bitwise_xor(codes[start:start + _BLOCK_ROWS], query_bits)].sum(axis=1, dtype=np.int32)
+                                        for start in range(0, len(codes), _BLOCK_ROWS)])
+            # fraction of agreeing signs mapped to [-1, 1] so it reads like a cosine
+            return 1.0 - 2.0 * distances.astype(np.float32) / query.shape[-1]
+        scores = np.concatenate([codes[start:start + _BLOCK_ROWS].astype(np.float32) @ query
+                                 for start in range(0, len(codes), _BLOCK_ROWS)])
+        if self.quantization == "int8":
+            scales = self.scales if rows is None else self.scales[rows]
+            scores *= scales
+        return scores
+
+    @staticmethod
+    def _save_array(path: str, array):
+        # the previous file may be the one memory-mapped by self.codes, so it is replaced
+        # atomically instead of being written over in place
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, np.asarray(array))
+        os.replace(path + ".tmp", path)
+
+    def save(self, prefix: str):
+        self._save_array(prefix + ".codes.npy", self.codes)
+        if self.scales is not None:
+            self._save_array(prefix + ".scales.npy", self.scales)
+
+    @classmethod
+    def load(cls, prefix: str, quantization: str, dimensions: int):
+        codes = np.load(prefix + ".codes.npy", mmap_mode="r")
+        scales = np.load(prefix + ".scales.npy") if quantization == "int8" else None
+        return cls(quantization, dimensions, codes, scales)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
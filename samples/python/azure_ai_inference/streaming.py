@@ -7,7 +7,7 @@ from azure.ai.inference.models import SystemMessage, UserMessage
 from azure.core.credentials import AzureKeyCredential
 
 token = os.environ["GITHUB_TOKEN"]
-endpoint = "https://models.inference.ai.azure.com"
+endpoint = os.getenv("GITHUB_MODELS_ENDPOINT", "https://models.inference.ai.azure.com")
 
 # By using the Azure AI Inference SDK, you can easily experiment with different models
 # by modifying the value of `model_name` in the code below. The following models are
@@ -20,7 +20,7 @@ from azure.core.credentials import AzureKeyCredential
 assert "GITHUB_TOKEN" in os.environ, "Please set the GITHUB_TOKEN environment variable."
 token = os.environ["GITHUB_TOKEN"]
 
-endpoint = "https://models.inference.ai.azure.com"
+endpoint = os.getenv("GITHUB_MODELS_ENDPOINT", "https://models.inference.ai.azure.com")
 
 # By using the Azure AI Inference SDK, you can easily experiment with different models
 # by modifying the value of `modelName` in the code below. For this code sample
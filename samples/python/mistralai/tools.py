@@ -8,7 +8,7 @@ from mistralai.client import MistralClient
 from mistralai.models.chat_completion import ChatMessage, Function
 
 token = os.environ["GITHUB_TOKEN"]
-endpoint = "https://models.inference.ai.azure.com"
+endpoint = os.getenv("GITHUB_MODELS_ENDPOINT", "https://models.inference.ai.azure.com")
 
 # Pick one of the Mistral models from the GitHub Models service
 model_name = "Mistral-large"
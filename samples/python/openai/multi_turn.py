@@ -7,7 +7,7 @@ import os
 from openai import OpenAI
 
 token = os.environ["GITHUB_TOKEN"]
-endpoint = "https://models.inference.ai.azure.com"
+endpoint = os.getenv("GITHUB_MODELS_ENDPOINT", "https://models.inference.ai.azure.com")
 
 # Pick one of the Azure OpenAI models from the GitHub Models service
 model_name = "gpt-4o-mini"